@@ -29,7 +29,11 @@ async def health():
             "performance_stats": {
                 "packets_dropped": getattr(state.packet_capture, "_packets_dropped", 0),
                 "packets_duplicate": getattr(state.packet_capture, "_packets_duplicate", 0),
-                "active_flows_count": len(getattr(state.packet_capture, "_active_flows", {})),
+                "flows_dropped": getattr(state.packet_capture, "_flows_dropped", 0),
+                "active_flows_count": (
+                    len(getattr(state.packet_capture, "_active_flows", {}))
+                    + len(getattr(state.packet_capture, "_new_flows", {}))
+                ),
             } if state.packet_capture else {},
             "flows_detected": state.packet_capture.flows_detected if state.packet_capture else 0,
         },
@@ -26,18 +26,20 @@ class AdvancedAnalyticsService:
         active_flows = [f for f in flows if f.status == "active"]
         active_threats = [t for t in threats if not t.dismissed]
 
+        now_ms = int(datetime.now().timestamp() * 1000)
+
         # Calculate time range
         if flows:
             timestamps = [f.timestamp for f in flows]
             oldest_flow = min(timestamps)
             newest_flow = max(timestamps)
         else:
-            oldest_flow = int(datetime.now().timestamp() * 1000)
+            oldest_flow = now_ms
             newest_flow = oldest_flow
 
         return {
             "total_devices": len(devices),
-            "active_devices": len([d for d in devices if (datetime.now().timestamp() * 1000) - d.lastSeen < 300000]),  # Active in last 5 min
+            "active_devices": sum(1 for d in devices if now_ms - d.lastSeen < 300000),  # Active in last 5 min
             "total_flows": len(flows),
             "active_flows": len(active_flows),
             "total_bytes": total_bytes,
@@ -1,11 +1,13 @@
 """
 Device fingerprinting and identification service
 """
+import asyncio
 import logging
 import uuid
 import socket
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Callable
-from datetime import datetime
+from time import time_ns
 
 try:
     from scapy.all import ARP
@@ -24,14 +26,24 @@ class DeviceFingerprintingService:
     def __init__(self, storage: StorageService, on_device_update: Optional[Callable] = None):
         self.storage = storage
         self.on_device_update = on_device_update
+        self._hostname_timeout = 2.0  # seconds
+        # Dedicated resolver threads: a timed-out lookup keeps its thread
+        # blocked, so it must not tie up the loop's default executor
+        self._hostname_executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="device-hostname"
+        )
 
     async def process_arp_packet(self, packet):
         """Process ARP packet for device discovery"""
-        if not SCAPY_AVAILABLE or not packet.haslayer(ARP):
+        if not SCAPY_AVAILABLE:
+            return
+
+        # Single walk of the layer chain (haslayer + packet[ARP] walks twice)
+        arp = packet.getlayer(ARP)
+        if arp is None:
             return
 
         try:
-            arp = packet[ARP]
             ip = arp.psrc
             mac = arp.hwsrc
 
@@ -57,7 +69,7 @@ class DeviceFingerprintingService:
 
         if device:
             # Update last seen
-            device.lastSeen = int(datetime.now().timestamp() * 1000)
+            device.lastSeen = time_ns() // 1_000_000
             await self.storage.upsert_device(device)
             # Notify of device update
             if self.on_device_update:
@@ -67,9 +79,10 @@ class DeviceFingerprintingService:
         # Create new device
         device_type = self._detect_device_type(ip, mac)
         vendor = self._detect_vendor(mac) if mac else "Unknown"
-        device_name = self._generate_device_name(ip, vendor, device_type)
+        hostname = await self._resolve_hostname(ip)
+        device_name = self._generate_device_name(ip, vendor, device_type, hostname)
 
-        now = int(datetime.now().timestamp() * 1000)
+        now = time_ns() // 1_000_000
 
         device = Device(
             id=str(uuid.uuid4()),
@@ -137,16 +150,26 @@ class DeviceFingerprintingService:
 
         return "Unknown"
 
-    def _generate_device_name(self, ip: str, vendor: str, device_type: str) -> str:
-        """Generate device name"""
-        # Try to resolve hostname
+    async def _resolve_hostname(self, ip: str) -> Optional[str]:
+        """Reverse-resolve an IP without blocking the event loop"""
         try:
-            hostname = socket.gethostbyaddr(ip)[0]
-            if hostname and hostname != ip:
-                return hostname.split('.')[0]
-        except (socket.herror, OSError):
+            hostname, _ = await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(
+                    self._hostname_executor, socket.getnameinfo, (ip, 0), socket.NI_NAMEREQD
+                ),
+                timeout=self._hostname_timeout
+            )
+        except (asyncio.TimeoutError, OSError):
             # Hostname resolution failed - use fallback
-            pass
+            return None
+        return hostname if hostname != ip else None
+
+    def _generate_device_name(
+        self, ip: str, vendor: str, device_type: str, hostname: Optional[str] = None
+    ) -> str:
+        """Generate device name"""
+        if hostname:
+            return hostname.split('.')[0]
 
         # Fallback to vendor + type
         if vendor != "Unknown":
@@ -6,10 +6,12 @@ import asyncio
 import logging
 import socket
 from typing import Optional, Dict, List
-from datetime import datetime
+from time import time
 from collections import defaultdict
 import re
 
+from utils.network import is_local_ip
+
 try:
     import dns.resolver
     DNS_AVAILABLE = True
@@ -20,6 +22,21 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
+def _packet_bytes(packet) -> bytes:
+    """Raw bytes of a packet without re-serializing it
+
+    Raw frame/payload bytes are used as-is. For Scapy packets dissected from
+    a captured buffer, that buffer (``original``) is returned instead of
+    ``bytes(packet)``, which rebuilds every layer.
+    """
+    if isinstance(packet, (bytes, bytearray)):
+        return packet
+    if isinstance(packet, memoryview):
+        return packet.tobytes()
+    original = getattr(packet, "original", None)
+    return original if original else bytes(packet)
+
+
 class EnhancedIdentificationService:
     """Service for enhanced hostname, server name, and application identification"""
     
@@ -103,7 +120,7 @@ class EnhancedIdentificationService:
         if not self.enable_dns_tracking:
             return
         
-        current_time = datetime.now().timestamp()
+        current_time = time()
         
         # Add IP to domain mapping
         if ip not in self._dns_query_cache[domain]:
@@ -120,7 +137,7 @@ class EnhancedIdentificationService:
         if not self.enable_dns_tracking:
             return None
         
-        current_time = datetime.now().timestamp()
+        current_time = time()
         
         # Find most recent domain for this IP
         best_domain = None
@@ -141,7 +158,7 @@ class EnhancedIdentificationService:
             return None
         
         # Check cache
-        current_time = datetime.now().timestamp()
+        current_time = time()
         if ip in self._reverse_dns_cache:
             cache_time = self._reverse_dns_cache_ttl.get(ip, 0)
             if current_time - cache_time < self._reverse_dns_cache_max_age:
@@ -179,14 +196,14 @@ class EnhancedIdentificationService:
         return None
     
     def extract_http_host(self, packet) -> Optional[str]:
-        """Extract Host header from HTTP packet"""
+        """Extract Host header from HTTP packet (Scapy packet or raw bytes)"""
         if not self.enable_http_host_extraction:
             return None
         
         try:
             # Try Scapy HTTP layer
             from scapy.layers.http import HTTPRequest
-            if packet.haslayer(HTTPRequest):
+            if not isinstance(packet, (bytes, bytearray, memoryview)) and packet.haslayer(HTTPRequest):
                 http = packet[HTTPRequest]
                 if hasattr(http, 'Host'):
                     host = http.Host
@@ -195,7 +212,7 @@ class EnhancedIdentificationService:
                     return host
             
             # Try raw packet inspection
-            raw = packet.raw if hasattr(packet, 'raw') else bytes(packet)
+            raw = _packet_bytes(packet)
             if b'Host:' in raw:
                 for line in raw.split(b'\r\n'):
                     if line.startswith(b'Host:'):
@@ -212,7 +229,7 @@ class EnhancedIdentificationService:
             return None
         
         try:
-            raw = packet.raw if hasattr(packet, 'raw') else bytes(packet)
+            raw = _packet_bytes(packet)
             
             # Look for ALPN extension (0x0010)
             alpn_start = raw.find(b'\x00\x10')
@@ -258,7 +275,7 @@ class EnhancedIdentificationService:
             return None
         
         try:
-            raw = packet.raw if hasattr(packet, 'raw') else bytes(packet)
+            raw = _packet_bytes(packet)
             
             # Check first 200 bytes for patterns
             payload = raw[:200] if len(raw) > 200 else raw
@@ -288,7 +305,7 @@ class EnhancedIdentificationService:
             return None
         
         try:
-            raw = packet.raw if hasattr(packet, 'raw') else bytes(packet)
+            raw = _packet_bytes(packet)
             payload = raw[:500] if len(raw) > 500 else raw
             
             # Extract printable strings
@@ -300,7 +317,7 @@ class EnhancedIdentificationService:
                 fingerprint = {
                     "banner": banner,
                     "port": port,
-                    "timestamp": datetime.now().timestamp()
+                    "timestamp": time()
                 }
                 
                 # Cache fingerprint
@@ -315,20 +332,7 @@ class EnhancedIdentificationService:
     
     def _is_local_ip(self, ip: str) -> bool:
         """Check if IP is local/private"""
-        if ip.startswith("192.168.") or ip.startswith("10.") or ip.startswith("127."):
-            return True
-        if ip.startswith("172."):
-            try:
-                parts = ip.split('.')
-                if len(parts) >= 2:
-                    second_octet = int(parts[1])
-                    if 16 <= second_octet <= 31:
-                        return True
-            except (ValueError, IndexError):
-                pass
-        if ip.startswith("169.254.") or ip.startswith("fe80:") or ip == "::1":
-            return True
-        return False
+        return is_local_ip(ip)
     
     def _cleanup_dns_cache(self, current_time: float):
         """Cleanup old DNS cache entries"""
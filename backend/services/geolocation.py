@@ -3,7 +3,8 @@ Geolocation service using GeoIP2
 """
 import logging
 from typing import Optional, Dict, Tuple
-import socket
+
+from utils.network import is_local_ip
 
 try:
     import geoip2.database
@@ -110,17 +111,7 @@ class GeolocationService:
 
     def _is_local_ip(self, ip: str) -> bool:
         """Check if IP is local/private"""
-        try:
-            socket.inet_aton(ip)
-            return (
-                ip.startswith("192.168.") or
-                ip.startswith("10.") or
-                ip.startswith("172.16.") or
-                ip.startswith("127.") or
-                ip.startswith("169.254.")  # Link-local
-            )
-        except (socket.error, OSError):
-            return False
+        return is_local_ip(ip)
 
     def close(self):
         """Close GeoIP2 database reader"""
@@ -1,30 +1,33 @@
 """
 Packet capture service using Scapy
 Captures network traffic and extracts flow information
+
+Frames are received raw and L2-L4 headers are parsed with struct; DNS, TLS
+and HTTP payloads are parsed from the wire bytes as well. Scapy only
+dissects ARP packets (device discovery).
 """
 import asyncio
+import itertools
 import logging
+import os
+import re
+import secrets
+import select
 import socket
-from typing import Optional, Callable, Dict, List
-from datetime import datetime
-import uuid
-from collections import defaultdict
+import struct
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional, Callable, Dict, List, Tuple
+from time import monotonic, monotonic_ns, time_ns
+from collections import deque
 
 try:
-    from scapy.all import sniff, get_if_list, IP, IPv6, TCP, UDP, ICMP, ARP
+    from scapy.all import conf, get_if_list
     from scapy.layers.l2 import Ether
-    from scapy.layers.dns import DNS
-    from scapy.layers.tls.handshake import TLSClientHello
-    try:
-        from scapy.layers.http import HTTPRequest
-    except ImportError:
-        HTTPRequest = None
     SCAPY_AVAILABLE = True
 except ImportError:
     SCAPY_AVAILABLE = False
-    HTTPRequest = None
-    IPv6 = None
-    TLSClientHello = None
     logging.warning("Scapy not available. Packet capture will be disabled.")
 
 from models.types import NetworkFlow
@@ -33,9 +36,426 @@ from services.threat_detection import ThreatDetectionService
 from services.storage import StorageService
 from services.geolocation import GeolocationService
 from services.enhanced_identification import EnhancedIdentificationService
+from utils.bpf import DEFAULT_BPF_FILTER
+from utils.lru import LRUDict
+from utils.network import is_local_ip
+from utils.packet_ring import PacketRing
 
 logger = logging.getLogger(__name__)
 
+# Flow key: (ip_a, port_a, ip_b, port_b, protocol), lower endpoint first so
+# both directions of a connection share one key
+FlowKey = Tuple[str, int, str, int, str]
+
+# Interned protocol names so flow-key tuples hash/compare on cached strings
+PROTO_TCP = sys.intern("TCP")
+PROTO_UDP = sys.intern("UDP")
+PROTO_ICMP = sys.intern("ICMP")
+PROTO_ARP = sys.intern("ARP")
+PROTO_OTHER = sys.intern("OTHER")
+
+ETH_P_IP = 0x0800
+ETH_P_ARP = 0x0806
+ETH_P_8021Q = 0x8100
+ETH_P_IPV6 = 0x86DD
+
+# IP protocol number -> protocol name (ICMPv6 is not tracked as a flow)
+IP_PROTOCOLS = {6: PROTO_TCP, 17: PROTO_UDP, 1: PROTO_ICMP}
+
+# Same mapping indexed directly by the IP protocol byte (None = not tracked)
+_PROTOCOL_TABLE = tuple(IP_PROTOCOLS.get(number) for number in range(256))
+
+# TCP flag bits; flows accumulate them as an int and only turn them into
+# names when the flow is finalized
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+TCP_URG = 0x20
+TCP_FLAG_MASK = 0x3F  # Flags we report (ECE/CWR are ignored)
+_TCP_FLAG_NAMES = tuple(
+    tuple(
+        name for bit, name in (
+            (TCP_SYN, "SYN"), (TCP_ACK, "ACK"), (TCP_FIN, "FIN"),
+            (TCP_RST, "RST"), (TCP_PSH, "PSH"), (TCP_URG, "URG"),
+        )
+        if combination & bit
+    )
+    for combination in range(TCP_FLAG_MASK + 1)
+)
+
+_PORTS = struct.Struct("!HH")
+# Fixed headers, unpacked in one call each (x = skipped bytes)
+# IPv4: version/IHL, total length, flags/fragment offset, TTL, protocol, src, dst
+_IPV4_HEADER = struct.Struct("!BxHxxHBBxx4s4s")
+# IPv6: payload length, next header, hop limit, src, dst
+_IPV6_HEADER = struct.Struct("!4xHBB16s16s")
+# TCP: ports, sequence number, data offset, flags
+_TCP_HEADER = struct.Struct("!HHIxxxxBB")
+_DNS_HEADER = struct.Struct("!HHHHHH")  # id, flags, qd/an/ns/ar counts
+_DNS_QUESTION = struct.Struct("!HH")  # qtype, qclass
+_DNS_RR = struct.Struct("!HHIH")  # type, class, ttl, rdlength
+_U16 = struct.Struct("!H")
+_TLS_EXTENSION = struct.Struct("!HH")  # type, length
+
+# HTTP request line, then (searched from where it ends) the User-Agent header
+_HTTP_REQUEST_RE = re.compile(rb"(GET|POST|PUT|DELETE|HEAD|OPTIONS|PATCH) (\S+) HTTP/")
+_HTTP_USER_AGENT_RE = re.compile(rb"\r\nUser-Agent:[ \t]*([^\r\n]+)", re.IGNORECASE)
+
+# Cache-miss sentinel for caches that store None
+_NOT_CACHED = object()
+
+# Ports whose payloads are inspected beyond the L4 header
+DNS_PORT = 53
+TLS_PORTS = frozenset((443, 8443, 993, 995))
+HTTP_PORTS = frozenset((80, 8080, 8000, 8888))
+
+# Well-known destination port -> application name
+PORT_APPLICATIONS = {
+    80: "HTTP",
+    443: "HTTPS",
+    22: "SSH",
+    21: "FTP",
+    25: "SMTP",
+    53: "DNS",
+    110: "POP3",
+    143: "IMAP",
+    993: "IMAPS",
+    995: "POP3S",
+    3306: "MySQL",
+    5432: "PostgreSQL",
+    3389: "RDP",
+    5900: "VNC",
+}
+
+
+class PacketHeaders(NamedTuple):
+    """L2-L4 header fields lifted from a raw Ethernet frame"""
+    ethertype: int
+    src_ip: Optional[str] = None
+    dst_ip: Optional[str] = None
+    ttl: Optional[int] = None
+    ip_proto: int = 0
+    src_port: int = 0
+    dst_port: int = 0
+    tcp_flags: int = 0
+    tcp_seq: Optional[int] = None
+    payload_offset: int = 0
+    payload_end: int = 0
+
+
+class DNSMessage(NamedTuple):
+    """DNS fields lifted from a raw DNS payload"""
+    is_response: bool
+    rcode: int
+    qname: Optional[str] = None
+    qtype: Optional[int] = None
+    addresses: Tuple[str, ...] = ()  # A/AAAA answer addresses
+
+
+class DelayWindow:
+    """Sliding window of inter-packet delays with running sums
+
+    The sum and sum of squares are updated as delays enter and leave the
+    window, so the variance costs O(1) per packet. Delays are integer
+    nanoseconds, so the sums stay exact.
+    """
+
+    __slots__ = ("last", "delays", "total", "total_sq")
+
+    def __init__(self, size: int):
+        self.last: Optional[int] = None
+        self.delays: deque = deque(maxlen=size)
+        self.total = 0
+        self.total_sq = 0
+
+    def add(self, timestamp_ns: int):
+        """Record a packet arrival"""
+        if self.last is not None:
+            delays = self.delays
+            if len(delays) == delays.maxlen:
+                dropped = delays[0]
+                self.total -= dropped
+                self.total_sq -= dropped * dropped
+            delay = timestamp_ns - self.last
+            delays.append(delay)
+            self.total += delay
+            self.total_sq += delay * delay
+        self.last = timestamp_ns
+
+    def variance(self) -> float:
+        """Population variance of the delays in the window"""
+        count = len(self.delays)
+        return (count * self.total_sq - self.total * self.total) / (count * count)
+
+
+class ActiveFlow:
+    """Mutable state of a flow that is still being tracked
+
+    Slotted rather than a dict: one of these lives per active flow and
+    is updated on every packet.
+    """
+
+    FIELDS = (
+        "id", "source_ip", "source_port", "dest_ip", "dest_port", "protocol",
+        "device_id", "bytes_in", "bytes_out", "packets_in", "packets_out",
+        "first_seen", "last_seen", "ttl", "retransmissions", "tcp_flags",
+        "connection_state", "domain", "sni", "application", "http_method",
+        "url", "user_agent", "dns_query_type", "dns_response_code", "rtt",
+        "jitter",
+    )
+    # Plus the RTT/jitter trackers, which are not part of the flow record
+    __slots__ = FIELDS + ("first_seen_ns", "packet_times", "delays")
+
+    def __init__(
+        self,
+        flow_id: str,
+        source_ip: str,
+        source_port: int,
+        dest_ip: str,
+        dest_port: int,
+        protocol: str,
+        device_id: str,
+        timestamp_ns: int,
+        ttl: Optional[int],
+    ):
+        self.id = flow_id
+        self.source_ip = source_ip
+        self.source_port = source_port
+        self.dest_ip = dest_ip
+        self.dest_port = dest_port
+        self.protocol = protocol
+        self.device_id = device_id
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.packets_in = 0
+        self.packets_out = 0
+        self.first_seen = self.last_seen = timestamp_ns // 1_000_000
+        self.ttl = ttl
+        self.retransmissions = 0
+        self.tcp_flags = 0  # TCP_* bitmask
+        self.connection_state: Optional[str] = None
+        self.domain: Optional[str] = None
+        self.sni: Optional[str] = None
+        self.application: Optional[str] = None
+        self.http_method: Optional[str] = None
+        self.url: Optional[str] = None
+        self.user_agent: Optional[str] = None
+        self.dns_query_type: Optional[str] = None
+        self.dns_response_code: Optional[str] = None
+        self.rtt: Optional[deque] = None  # Last 5 RTT samples (ms)
+        self.jitter: Optional[float] = None
+        # RTT/jitter trackers, created on the second packet (start_trackers)
+        # so one-packet flows such as scan probes never allocate them
+        self.first_seen_ns = timestamp_ns
+        self.packet_times: Optional[deque] = None  # For RTT estimation
+        self.delays: Optional[DelayWindow] = None  # Last 20 packets, for jitter
+
+    def start_trackers(self):
+        """Create the RTT/jitter trackers, seeded with the first packet"""
+        self.packet_times = deque((self.first_seen_ns,), maxlen=10)
+        self.delays = DelayWindow(19)
+        self.delays.add(self.first_seen_ns)
+
+    @property
+    def duration(self) -> int:
+        return self.last_seen - self.first_seen
+
+    def average_rtt(self) -> Optional[int]:
+        """Mean of the recorded RTT samples, or None without samples"""
+        if not self.rtt:
+            return None
+        return int(sum(self.rtt) / len(self.rtt))
+
+    def as_dict(self) -> dict:
+        """Flow fields as a dict for analyzers (unset fields are omitted,
+        TCP flags are named and RTT is averaged)"""
+        data = {}
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        data["duration"] = self.duration
+        # Flagless flows (UDP, ICMP) leave the key out, as analyzers expect
+        tcp_flags = tcp_flag_names(self.tcp_flags)
+        if tcp_flags is None:
+            del data["tcp_flags"]
+        else:
+            data["tcp_flags"] = tcp_flags
+        rtt = self.average_rtt()
+        if rtt is None:
+            data.pop("rtt", None)
+        else:
+            data["rtt"] = rtt
+        return data
+
+
+def _skip_dns_name(data: bytes, offset: int) -> int:
+    """Return the offset just past the (possibly compressed) name at offset"""
+    while True:
+        length = data[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:
+            return offset + 2  # Compression pointer ends the name
+        offset += length + 1
+
+
+def _read_dns_name(data: bytes, offset: int) -> str:
+    """Decode the name at offset, following compression pointers"""
+    labels = []
+    for _ in range(128):  # Bounded so pointer loops can't spin forever
+        length = data[offset]
+        if length == 0:
+            return ".".join(labels)
+        if length & 0xC0 == 0xC0:
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        labels.append(data[offset + 1:offset + 1 + length].decode("utf-8"))
+        offset += length + 1
+    raise ValueError("DNS name too long")
+
+
+def parse_dns(payload: bytes, tcp: bool = False) -> Optional[DNSMessage]:
+    """Parse the header, first question and A/AAAA answers of a DNS message
+
+    Args:
+        payload: UDP or TCP payload
+        tcp: Payload carries the 2-byte DNS-over-TCP length prefix
+
+    Returns None for truncated or malformed messages.
+    """
+    if tcp:
+        payload = payload[2:]
+    try:
+        _, flags, qdcount, ancount, _, _ = _DNS_HEADER.unpack_from(payload)
+        is_response = bool(flags & 0x8000)
+        rcode = flags & 0x000F
+
+        offset = _DNS_HEADER.size
+        qname = qtype = None
+        for i in range(qdcount):
+            if i == 0:
+                qname = _read_dns_name(payload, offset)
+            offset = _skip_dns_name(payload, offset)
+            if i == 0:
+                qtype = _DNS_QUESTION.unpack_from(payload, offset)[0]
+            offset += _DNS_QUESTION.size
+
+        addresses = []
+        if is_response:
+            for _ in range(ancount):
+                offset = _skip_dns_name(payload, offset)
+                rtype, _, _, rdlength = _DNS_RR.unpack_from(payload, offset)
+                offset += _DNS_RR.size
+                if rtype == 1 and rdlength == 4:
+                    addresses.append(socket.inet_ntoa(payload[offset:offset + 4]))
+                elif rtype == 28 and rdlength == 16:
+                    addresses.append(socket.inet_ntop(socket.AF_INET6, payload[offset:offset + 16]))
+                offset += rdlength
+    except (struct.error, IndexError, ValueError):
+        return None
+
+    return DNSMessage(is_response, rcode, qname, qtype, tuple(addresses))
+
+
+def tcp_flag_names(flags: int) -> Optional[List[str]]:
+    """Names of the TCP flags set in a flag bitmask (None if none are set)"""
+    names = _TCP_FLAG_NAMES[flags & TCP_FLAG_MASK]
+    return list(names) if names else None
+
+
+def parse_tls_sni(payload: bytes) -> Optional[str]:
+    """Return the server name from a TLS ClientHello record, if present
+
+    Walks the record's length-prefixed fields directly to the extensions
+    block, so only the bytes before the server_name extension are touched.
+    """
+    try:
+        # TLS record (0x16 handshake) carrying a ClientHello (0x01)
+        if payload[0] != 0x16 or payload[5] != 0x01:
+            return None
+        # Record header (5) + handshake header (4) + version (2) + random (32)
+        offset = 43
+        offset += 1 + payload[offset]  # Session ID
+        offset += 2 + _U16.unpack_from(payload, offset)[0]  # Cipher suites
+        offset += 1 + payload[offset]  # Compression methods
+        end = min(len(payload), offset + 2 + _U16.unpack_from(payload, offset)[0])
+        offset += 2
+
+        while offset + 4 <= end:
+            ext_type, ext_len = _TLS_EXTENSION.unpack_from(payload, offset)
+            offset += 4
+            if ext_type == 0:  # server_name
+                # Server name list length (2), name type (1), name length (2)
+                if payload[offset + 2] != 0:  # host_name
+                    return None
+                name_len = _U16.unpack_from(payload, offset + 3)[0]
+                hostname = payload[offset + 5:offset + 5 + name_len]
+                if len(hostname) != name_len:
+                    return None  # Truncated (ClientHello split across segments)
+                hostname = hostname.decode('utf-8', errors='ignore')
+                return hostname if '.' in hostname else None
+            offset += ext_len
+    except (IndexError, struct.error):
+        pass
+    return None
+
+
+def parse_headers(raw: bytes) -> Optional[PacketHeaders]:
+    """Parse Ethernet/IP/TCP/UDP headers from a raw frame without Scapy
+
+    Returns None for frames that are too short or not IPv4/IPv6/ARP.
+    """
+    size = len(raw)
+    if size < 14:
+        return None
+
+    ethertype = (raw[12] << 8) | raw[13]
+    offset = 14
+    if ethertype == ETH_P_8021Q and size >= 18:
+        ethertype = (raw[16] << 8) | raw[17]
+        offset = 18
+
+    if ethertype == ETH_P_IP:
+        if size < offset + 20:
+            return None
+        version_ihl, total_length, fragment, ttl, ip_proto, src, dst = _IPV4_HEADER.unpack_from(raw, offset)
+        src_ip = socket.inet_ntoa(src)
+        dst_ip = socket.inet_ntoa(dst)
+        l4 = offset + (version_ihl & 0x0F) * 4
+        end = min(size, offset + total_length) if total_length else size
+        if fragment & 0x1FFF:
+            # Non-first fragments carry no L4 header
+            return PacketHeaders(ethertype, src_ip, dst_ip, ttl, ip_proto, payload_offset=l4, payload_end=l4)
+    elif ethertype == ETH_P_IPV6:
+        if size < offset + 40:
+            return None
+        payload_length, ip_proto, ttl, src, dst = _IPV6_HEADER.unpack_from(raw, offset)  # ttl = hop limit
+        src_ip = socket.inet_ntop(socket.AF_INET6, src)
+        dst_ip = socket.inet_ntop(socket.AF_INET6, dst)
+        l4 = offset + 40
+        end = min(size, l4 + payload_length) if payload_length else size
+    elif ethertype == ETH_P_ARP:
+        return PacketHeaders(ethertype)
+    else:
+        return None
+
+    if ip_proto == 6 and end >= l4 + 20:
+        src_port, dst_port, seq, data_offset, flags = _TCP_HEADER.unpack_from(raw, l4)
+        return PacketHeaders(
+            ethertype, src_ip, dst_ip, ttl, ip_proto, src_port, dst_port,
+            flags, seq, min(l4 + (data_offset >> 4) * 4, end), end
+        )
+    if ip_proto == 17 and end >= l4 + 8:
+        src_port, dst_port = _PORTS.unpack_from(raw, l4)
+        return PacketHeaders(
+            ethertype, src_ip, dst_ip, ttl, ip_proto, src_port, dst_port,
+            payload_offset=l4 + 8, payload_end=end
+        )
+    return PacketHeaders(ethertype, src_ip, dst_ip, ttl, ip_proto, payload_offset=l4, payload_end=l4)
+
 
 class PacketCaptureService:
     def __init__(
@@ -46,7 +466,10 @@ class PacketCaptureService:
         storage: Optional[StorageService] = None,
         geolocation_service: Optional[GeolocationService] = None,
         on_flow_update: Optional[Callable] = None,
-        enhanced_identification: Optional[EnhancedIdentificationService] = None
+        enhanced_identification: Optional[EnhancedIdentificationService] = None,
+        bpf_filter: Optional[str] = None,
+        enable_dedup: bool = False,
+        capture_cpu: Optional[int] = None,
     ):
         self.interface = interface
         self.device_service = device_service
@@ -58,46 +481,76 @@ class PacketCaptureService:
 
         self._running = False
         self._capture_task: Optional[asyncio.Task] = None
+        self._capture_thread: Optional[threading.Thread] = None
+        self._capture_cpu: Optional[int] = None
+        # Configured capture settings, reapplied on each (re)start
+        self._configured_bpf_filter = bpf_filter or DEFAULT_BPF_FILTER
+        self._configured_dedup = enable_dedup
+        self._configured_capture_cpu = capture_cpu
+        self._capture_niceness = -10  # Best effort, needs CAP_SYS_NICE
         self.packets_captured = 0
         self.flows_detected = 0
 
-        # Active flows tracking:
-        # (src_ip, src_port, dst_ip, dst_port, protocol) -> flow_data
-        self._active_flows: Dict[str, dict] = {}
-
-        # Lock for thread-safe access to _active_flows
-        self._flows_lock = asyncio.Lock()
-
-        # DNS resolution cache: IP -> domain
-        self._dns_cache: Dict[str, str] = {}
+        # Flow IDs: random per-process prefix + monotonically increasing
+        # counter (unique across restarts without a uuid4 per flow)
+        self._flow_id_prefix = secrets.token_hex(4)
+        self._flow_id_counter = itertools.count(1)
 
-        # Lock for thread-safe access to _dns_cache
-        self._dns_cache_lock = asyncio.Lock()
-
-        # RTT tracking: flow_key -> list of timestamps for RTT calculation
-        self._rtt_tracking: Dict[str, List[float]] = defaultdict(list)
-
-        # Packet timestamps for jitter calculation
-        self._packet_timestamps: Dict[str, List[float]] = defaultdict(list)
+        # Memory limits for Pi (prevent unbounded growth)
+        self._max_active_flows = 65536  # Max concurrent flows
+        self._max_new_flows = 16384  # Max flows on probation
+        self._flow_promotion_packets = 3  # Packets before a new flow is promoted
+        self._max_dns_cache_size = 16384  # Max DNS cache entries
+        self._max_retransmission_tracking = 65536  # Max (flow, seq) entries
 
-        # Retransmission tracking: (src_ip, src_port, dst_ip, dst_port, seq) -> count
-        self._retransmissions: Dict[str, int] = defaultdict(int)
+        # Active flows tracking (LRU-bounded; evicted flows are finalized):
+        # (src_ip, src_port, dst_ip, dst_port, protocol) -> flow_data
+        # New flows start in the small probation table and move to the main
+        # table once they reach _flow_promotion_packets, so floods of one- or
+        # two-packet flows (scans, probes) churn through probation instead of
+        # evicting established flows
+        self._evicted_flows: List[Tuple[FlowKey, ActiveFlow]] = []
+        evict = lambda key, data: self._evicted_flows.append((key, data))
+        self._active_flows: Dict[FlowKey, ActiveFlow] = LRUDict(
+            self._max_active_flows, on_evict=evict
+        )
+        self._new_flows: Dict[FlowKey, ActiveFlow] = LRUDict(
+            self._max_new_flows, on_evict=evict
+        )
 
-        # Connection state tracking: flow_key -> state
-        self._connection_states: Dict[str, str] = {}
+        # DNS resolution cache: IP -> domain
+        # ("" = lookup failed, None = reverse lookup pending)
+        self._dns_cache: Dict[str, Optional[str]] = LRUDict(self._max_dns_cache_size)
+        # Failed reverse lookups are retried after a while: IP -> retry_at
+        self._dns_retry_at: Dict[str, float] = LRUDict(self._max_dns_cache_size)
+        self._dns_failure_ttl = 60.0  # seconds
+
+        # Background reverse DNS resolution (never blocks packet processing)
+        self._resolve_queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+        self._resolver_worker_count = 4
+        self._resolver_tasks: List[asyncio.Task] = []
+        # Lookups run on their own threads (one per worker): a timed-out
+        # lookup keeps its thread blocked in the resolver, and must not tie
+        # up the default executor
+        self._resolver_executor: Optional[ThreadPoolExecutor] = None
+        self._reverse_dns_timeout = 2.0  # seconds
+
+        # Retransmission tracking: (flow_key, seq) -> count (LRU-bounded;
+        # RTT/jitter trackers live on the flow itself)
+        self._retransmissions: Dict[Tuple[FlowKey, int], int] = LRUDict(
+            self._max_retransmission_tracking
+        )
 
         # Batch write queue for database operations (Pi optimization)
-        self._write_queue: List[NetworkFlow] = []
-        self._write_queue_lock = asyncio.Lock()
-        self._batch_size = 50  # Write in batches of 50 flows
-        self._batch_interval = 5.0  # Or every 5 seconds, whichever comes first
-        self._last_batch_write = datetime.now().timestamp()
-
-        # Memory limits for Pi (prevent unbounded growth)
-        self._max_active_flows = 10000  # Max concurrent flows
-        self._max_dns_cache_size = 1000  # Max DNS cache entries
-        self._max_rtt_tracking_size = 5000  # Max RTT tracking entries
-        self._max_retransmission_tracking = 10000  # Max retransmission entries
+        # Finalized flows are handed to a background writer instead of being
+        # awaited on the packet path; it runs threat analysis and enrichment,
+        # then writes one transaction and sends one client message per batch
+        self._write_queue: asyncio.Queue = asyncio.Queue(maxsize=10000)
+        # Max flows per batch write, adapted to the backlog between these bounds
+        self._batch_size = 100
+        self._min_batch_size = 50
+        self._max_batch_size = 500
+        self._flush_task: Optional[asyncio.Task] = None
 
         # Packet capture optimizations
         self._bpf_filter = None  # BPF filter string (e.g., "tcp or udp")
@@ -106,45 +559,79 @@ class PacketCaptureService:
         self._enable_ipv6 = True  # Enable IPv6 support
         self._skip_local_traffic = False  # Skip localhost traffic
         
-        # Layer cache for performance (avoid repeated haslayer() calls)
-        self._layer_cache: Dict[str, bool] = {}
-        self._layer_cache_size = 1000
-
-        # Packet processing queue for batching (reduces async overhead)
-        self._packet_queue: List = []
-        self._packet_queue_lock = asyncio.Lock()
-        self._packet_batch_size = 100  # Process packets in batches
+        # Parsed frames handed off from the capture thread as
+        # (raw, headers, shard, timestamp_ns); deque appends are atomic, so no
+        # coroutine/future is scheduled per packet
+        self._packet_queue: deque = deque(maxlen=100000)
+        self._packet_event = asyncio.Event()
+        self._packet_batch_size = 512  # Max packets processed per wakeup
+        self._packet_drain_interval = 0.1  # Fallback wakeup if a signal is missed
+        self._recv_buffer_size = 65535  # Largest frame read from the socket
+        self._use_packet_ring = True  # Use the AF_PACKET mmap ring on Linux
         self._packet_queue_task: Optional[asyncio.Task] = None
 
+        # Packets are sharded by (direction-independent) flow hash onto
+        # per-shard worker tasks: a flow's packets stay in order, while a
+        # worker awaiting a device/DNS lookup doesn't stall other shards
+        self._shard_count = 16  # Must be a power of two
+        self._shard_queue_size = 8192
+        self._shard_queues: List[asyncio.Queue] = []
+        self._shard_tasks: List[asyncio.Task] = []
+
         # Device lookup cache (reduce async database calls)
-        self._device_cache: Dict[str, str] = {}  # IP -> device_id
-        self._device_cache_ttl: Dict[str, float] = {}  # IP -> timestamp
+        # IP -> (device_id, expires_at); LRU-bounded
+        self._device_cache: Dict[str, Tuple[str, float]] = LRUDict(self._max_dns_cache_size)
         self._device_cache_max_age = 300.0  # 5 minutes
+        # In-flight device lookups: ip -> future
+        self._device_lookups: Dict[str, asyncio.Future] = {}
 
-        # Flow key cache (avoid string concatenation overhead)
-        self._flow_key_cache: Dict[tuple, str] = {}
-        self._flow_key_cache_size = 5000
-
-        # Packet deduplication (skip duplicate packets)
-        self._packet_hash_cache: Dict[int, float] = {}  # hash -> timestamp
-        self._packet_hash_cache_size = 10000
-        self._packet_dedup_window = 0.001  # 1ms window for duplicates
+        # Geolocation cache for flow destinations (popular endpoints are
+        # looked up once): IP -> (location, expires_at); LRU-bounded
+        self._geo_cache: Dict[str, Tuple[Dict[str, Optional[str]], float]] = LRUDict(
+            self._max_dns_cache_size
+        )
+        self._geo_cache_max_age = 3600.0  # 1 hour
+
+        # Packet deduplication (opt-in, see start(enable_dedup=...))
+        # Two generations of frame hashes, rotated every dedup window: a frame
+        # is a duplicate if either generation has it (no per-entry timestamps
+        # or eviction scans)
+        self._dedup_current: set = set()
+        self._dedup_previous: set = set()
+        self._dedup_generation_start = monotonic_ns()
+        self._packet_hash_cache_size = 10000  # Max hashes per generation
+        self._packet_dedup_window_ns = 1_000_000  # 1ms window for duplicates
+        self._enable_dedup = False
 
         # Performance metrics
         self._processing_times: List[float] = []
         self._packets_dropped = 0
         self._packets_duplicate = 0
+        self._flows_dropped = 0  # Finalized flows dropped on a full write queue
 
     def is_running(self) -> bool:
         """Check if capture is running"""
         return self._running
 
-    async def start(self, bpf_filter: Optional[str] = None, sampling_rate: float = 1.0):
+    async def start(
+        self,
+        bpf_filter: Optional[str] = None,
+        sampling_rate: float = 1.0,
+        enable_dedup: Optional[bool] = None,
+        capture_cpu: Optional[int] = None,
+    ):
         """Start packet capture
-        
+
+        Settings left as None use the values given to the constructor, so
+        a restart (e.g. through the capture API) keeps the configured ones.
+
         Args:
-            bpf_filter: BPF filter string (e.g., "tcp or udp" to skip ICMP/ARP)
+            bpf_filter: BPF filter string (default: DEFAULT_BPF_FILTER;
+                e.g., "tcp or udp" to skip ICMP/ARP)
             sampling_rate: Packet sampling rate (1.0 = all, 0.5 = 50%, etc.)
+            enable_dedup: Drop identical frames seen within 1ms (only useful
+                when the capture port sees traffic twice, e.g. a mirror/tee)
+            capture_cpu: Pin the capture thread to this CPU core (None = no pinning)
         """
         if not SCAPY_AVAILABLE:
             logger.error("Scapy not available. Cannot start packet capture.")
@@ -166,14 +653,31 @@ class PacketCaptureService:
                 logger.info(f"Using interface: {self.interface}")
 
         # Set capture optimizations
-        self._bpf_filter = bpf_filter or "ip or ip6"  # Default: capture IP/IPv6
+        self._bpf_filter = bpf_filter or self._configured_bpf_filter
         self._packet_sampling_rate = max(0.01, min(1.0, sampling_rate))  # Clamp 0.01-1.0
+        self._enable_dedup = self._configured_dedup if enable_dedup is None else enable_dedup
+        self._capture_cpu = self._configured_capture_cpu if capture_cpu is None else capture_cpu
         
         self._running = True
         self._capture_task = asyncio.create_task(self._capture_loop())
         self._cleanup_task = asyncio.create_task(self._periodic_cleanup())
-        self._batch_write_task = asyncio.create_task(self._batch_write_loop())
-        self._packet_queue_task = asyncio.create_task(self._process_packet_queue())
+        self._flush_task = asyncio.create_task(self._flush_worker())
+        self._shard_queues = [
+            asyncio.Queue(maxsize=self._shard_queue_size)
+            for _ in range(self._shard_count)
+        ]
+        self._shard_tasks = [
+            asyncio.create_task(self._shard_worker(queue))
+            for queue in self._shard_queues
+        ]
+        self._packet_queue_task = asyncio.create_task(self._drain_packet_queue())
+        self._resolver_executor = ThreadPoolExecutor(
+            max_workers=self._resolver_worker_count, thread_name_prefix="reverse-dns"
+        )
+        self._resolver_tasks = [
+            asyncio.create_task(self._reverse_dns_worker())
+            for _ in range(self._resolver_worker_count)
+        ]
         logger.info(
             f"Packet capture started on {self.interface} "
             f"(filter: {self._bpf_filter}, sampling: {self._packet_sampling_rate*100:.1f}%)"
@@ -186,9 +690,6 @@ class PacketCaptureService:
 
         self._running = False
 
-        # Flush any pending writes
-        await self._flush_write_queue()
-
         # Cancel tasks
         if self._capture_task:
             self._capture_task.cancel()
@@ -197,12 +698,12 @@ class PacketCaptureService:
             except asyncio.CancelledError:
                 pass
 
-        if self._batch_write_task:
-            self._batch_write_task.cancel()
-            try:
-                await self._batch_write_task
-            except asyncio.CancelledError:
-                pass
+        # The capture thread notices _running within one select timeout
+        if self._capture_thread:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._capture_thread.join, 2.0
+            )
+            self._capture_thread = None
 
         if self._packet_queue_task:
             self._packet_queue_task.cancel()
@@ -218,6 +719,16 @@ class PacketCaptureService:
             except asyncio.CancelledError:
                 pass
 
+        for task in self._shard_tasks + self._resolver_tasks:
+            task.cancel()
+        await asyncio.gather(*self._shard_tasks, *self._resolver_tasks, return_exceptions=True)
+        self._shard_tasks = []
+        self._resolver_tasks = []
+        if self._resolver_executor:
+            # Don't wait for lookups stuck in the resolver
+            self._resolver_executor.shutdown(wait=False, cancel_futures=True)
+            self._resolver_executor = None
+
         # Cancel cleanup task
         if hasattr(self, '_cleanup_task') and self._cleanup_task:
             self._cleanup_task.cancel()
@@ -226,202 +737,209 @@ class PacketCaptureService:
             except asyncio.CancelledError:
                 pass
 
-        # Finalize all remaining active flows
+        # Finalize all remaining active flows, then let the writer drain
         await self._finalize_all_flows()
+        if self._flush_task:
+            await self._write_queue.join()
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
 
         logger.info("Packet capture stopped")
 
     async def _capture_loop(self):
         """Main capture loop - runs packet capture in executor"""
-        loop = asyncio.get_event_loop()
-
-        def packet_handler(packet):
-            """Handle captured packet with early filtering and queuing"""
+        loop = asyncio.get_running_loop()
+        packet_queue = self._packet_queue
+        packet_event = self._packet_event
+        shard_mask = self._shard_count - 1
+
+        def packet_handler(raw: bytes, timestamp_ns: int):
+            """Handle captured frame with early filtering and queuing
+
+            Header parsing and shard selection are synchronous CPU work, so
+            they run here on the capture thread; the event loop only
+            dispatches parsed frames.
+            """
             try:
                 # Packet sampling for high-rate traffic (Pi optimization)
                 if self._packet_sampling_rate < 1.0:
                     self._sampling_counter += 1
                     if (self._sampling_counter % int(1.0 / self._packet_sampling_rate)) != 0:
                         return  # Skip this packet
+
+                headers = parse_headers(raw)
+                if headers is None:
+                    return  # Malformed or not a frame type we care about
                 
-                # Packet deduplication (skip duplicates within 1ms window)
-                packet_hash = hash((packet.time, len(packet)))
-                current_time = datetime.now().timestamp()
-                if packet_hash in self._packet_hash_cache:
-                    cache_time = self._packet_hash_cache[packet_hash]
-                    if current_time - cache_time < self._packet_dedup_window:
+                # Packet deduplication (skip identical frames within 1ms window)
+                if self._enable_dedup:
+                    packet_hash = hash(raw)
+                    current_time = monotonic_ns()
+                    elapsed = current_time - self._dedup_generation_start
+                    if elapsed >= self._packet_dedup_window_ns or len(self._dedup_current) >= self._packet_hash_cache_size:
+                        # Rotate generations; after a quiet gap both are stale
+                        if elapsed >= 2 * self._packet_dedup_window_ns:
+                            self._dedup_previous = set()
+                        else:
+                            self._dedup_previous = self._dedup_current
+                        self._dedup_current = set()
+                        self._dedup_generation_start = current_time
+                    if packet_hash in self._dedup_current or packet_hash in self._dedup_previous:
                         self._packets_duplicate += 1
                         return  # Skip duplicate
-                
-                # Update deduplication cache
-                if len(self._packet_hash_cache) > self._packet_hash_cache_size:
-                    # Remove oldest 20%
-                    keys_to_remove = list(self._packet_hash_cache.keys())[:self._packet_hash_cache_size // 5]
-                    for key in keys_to_remove:
-                        del self._packet_hash_cache[key]
-                self._packet_hash_cache[packet_hash] = current_time
+                    self._dedup_current.add(packet_hash)
                 
                 self.packets_captured += 1
-                
-                # Queue packet for batch processing (reduces async overhead)
-                asyncio.run_coroutine_threadsafe(
-                    self._queue_packet(packet),
-                    loop
-                )
+
+                # Hand off to the drain task; only wake the loop when the
+                # queue goes from empty to non-empty
+                # XOR of both endpoints so either direction lands on the same shard
+                shard = (
+                    hash(headers.src_ip) ^ hash(headers.dst_ip)
+                    ^ headers.src_port ^ headers.dst_port
+                ) & shard_mask
+
+                was_empty = not packet_queue
+                if len(packet_queue) == packet_queue.maxlen:
+                    self._packets_dropped += 1  # Oldest packet is evicted
+                packet_queue.append((raw, headers, shard, timestamp_ns))
+                if was_empty:
+                    loop.call_soon_threadsafe(packet_event.set)
             except Exception as e:
                 logger.error(f"Error handling packet: {e}")
                 self._packets_dropped += 1
 
+        # Blocking receive loop runs on its own long-lived thread instead of
+        # occupying a slot in the default executor
+        done = loop.create_future()
+
+        def finish(error: Optional[BaseException]):
+            if done.done():
+                return  # Capture task was cancelled by stop()
+            if error is None:
+                done.set_result(None)
+            else:
+                done.set_exception(error)
+
+        def capture_thread():
+            self._tune_capture_thread()
+            error = None
+            try:
+                self._receive_frames(packet_handler)
+            except Exception as e:
+                error = e
+            try:
+                loop.call_soon_threadsafe(finish, error)
+            except RuntimeError:
+                pass  # Event loop already closed
+
+        self._capture_thread = threading.Thread(
+            target=capture_thread, name="packet-capture", daemon=True
+        )
+        self._capture_thread.start()
         try:
-            # Run sniff in executor with BPF filter for performance
-            await asyncio.to_thread(
-                sniff,
-                iface=self.interface,
-                prn=packet_handler,
-                stop_filter=lambda x: not self._running,
-                store=False,
-                filter=self._bpf_filter  # BPF filter reduces kernel->user overhead
-            )
+            await done
         except Exception as e:
             logger.error(f"Capture error: {e}")
             self._running = False
 
-    def _extract_tcp_flags(self, packet) -> Optional[List[str]]:
-        """Extract TCP flags from packet"""
-        if not packet.haslayer(TCP):
-            return None
-        tcp = packet[TCP]
-        return self._extract_tcp_flags_fast(tcp)
-
-    def _extract_tcp_flags_fast(self, tcp) -> Optional[List[str]]:
-        """Extract TCP flags from TCP layer (optimized, no packet lookup)"""
-        flags = []
-        flags_int = tcp.flags
-        if flags_int & 0x02:  # SYN
-            flags.append("SYN")
-        if flags_int & 0x10:  # ACK
-            flags.append("ACK")
-        if flags_int & 0x01:  # FIN
-            flags.append("FIN")
-        if flags_int & 0x04:  # RST
-            flags.append("RST")
-        if flags_int & 0x08:  # PSH
-            flags.append("PSH")
-        if flags_int & 0x20:  # URG
-            flags.append("URG")
-
-        return flags if flags else None
-
-    def _get_connection_state(self, tcp_flags: Optional[List[str]], current_state: Optional[str]) -> str:
-        """Determine TCP connection state from flags"""
+    def _tune_capture_thread(self):
+        """Pin the calling capture thread and raise its priority (best effort)"""
+        if self._capture_cpu is not None and hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(0, {self._capture_cpu})  # 0 = calling thread
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not pin capture thread to CPU {self._capture_cpu}: {e}")
+
+        if self._capture_niceness is not None and hasattr(os, "setpriority"):
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self._capture_niceness)
+            except OSError as e:
+                logger.debug(f"Could not raise capture thread priority: {e}")
+
+    def _receive_frames(self, packet_handler: Callable[[bytes, int], None]):
+        """Receive raw frames until capture is stopped
+
+        Prefers the AF_PACKET mmap ring on Linux; otherwise uses Scapy's L2
+        listen socket directly. Either way frames are never dissected into
+        Scapy packet objects on the capture path. Each frame is passed with
+        its receive time (time_ns).
+        """
+        if self._use_packet_ring and PacketRing.is_supported():
+            ring = PacketRing(self.interface)
+            try:
+                ring.open(self._bpf_filter)
+            except Exception as e:
+                logger.warning(f"AF_PACKET ring unavailable, falling back to L2 socket: {e}")
+                ring.close()
+            else:
+                try:
+                    ring.run(packet_handler, lambda: self._running)
+                finally:
+                    ring.close()
+                return
+
+        # BPF filter is applied in the kernel (reduces kernel->user overhead)
+        sock = conf.L2listen(iface=self.interface, filter=self._bpf_filter)
+
+        # On Linux the listen socket wraps a plain AF_PACKET socket: receive
+        # into one preallocated buffer and copy out only the frame bytes.
+        # This skips recv_raw()'s per-packet timestamp ioctl and ancillary
+        # data handling (we don't use either).
+        kernel_sock = getattr(sock, "ins", None)
+        if not isinstance(kernel_sock, socket.socket):
+            kernel_sock = None
+        recv_buffer = bytearray(self._recv_buffer_size)
+        recv_view = memoryview(recv_buffer)
+
+        try:
+            while self._running:
+                # Short select timeout so stop() is honoured on quiet links
+                ready, _, _ = select.select([sock], [], [], 0.5)
+                if not ready:
+                    continue
+                if kernel_sock is not None:
+                    size = kernel_sock.recv_into(recv_buffer)
+                    raw = bytes(recv_view[:size])
+                else:
+                    _, raw, _ = sock.recv_raw()
+                if raw:
+                    packet_handler(raw, time_ns())
+        finally:
+            recv_view.release()
+            sock.close()
+
+    def _get_connection_state(self, tcp_flags: int, current_state: Optional[str]) -> str:
+        """Determine TCP connection state from the TCP flag bits"""
         if not tcp_flags:
             return current_state or "UNKNOWN"
 
-        flags_set = set(tcp_flags)
-
-        if "SYN" in flags_set and "ACK" not in flags_set:
-            return "SYN_SENT"
-        elif "SYN" in flags_set and "ACK" in flags_set:
-            return "SYN_RECEIVED"
-        elif "ACK" in flags_set and "SYN" not in flags_set and "FIN" not in flags_set:
-            if current_state in ["SYN_SENT", "SYN_RECEIVED"]:
+        if tcp_flags & TCP_SYN:
+            return "SYN_RECEIVED" if tcp_flags & TCP_ACK else "SYN_SENT"
+        elif tcp_flags & TCP_ACK and not tcp_flags & TCP_FIN:
+            if current_state == "SYN_SENT" or current_state == "SYN_RECEIVED":
                 return "ESTABLISHED"
             return current_state or "ESTABLISHED"
-        elif "FIN" in flags_set:
+        elif tcp_flags & TCP_FIN:
             return "FIN_WAIT"
-        elif "RST" in flags_set:
+        elif tcp_flags & TCP_RST:
             return "RESET"
 
         return current_state or "ESTABLISHED"
 
-    def _extract_tls_sni(self, packet) -> Optional[str]:
-        """Extract Server Name Indication (SNI) from TLS handshake (enhanced)"""
-        # Method 1: Try Scapy TLS layer (most reliable)
-        try:
-            if self._has_layer_cached(packet, "TLS"):
-                tls = packet.getlayer("TLS")
-                if tls:
-                    # Look for ClientHello message
-                    if hasattr(tls, 'msg') and hasattr(tls.msg, 'ext'):
-                        for ext in tls.msg.ext:
-                            if hasattr(ext, 'servernames'):
-                                for name in ext.servernames:
-                                    if hasattr(name, 'servername'):
-                                        sni = name.servername
-                                        if isinstance(sni, bytes):
-                                            sni = sni.decode('utf-8', errors='ignore')
-                                        if sni and '.' in sni:
-                                            return sni
-        except Exception:
-            pass
-
-        # Method 2: Try TLSClientHello layer (Scapy 2.4.5+)
-        try:
-            if TLSClientHello and self._has_layer_cached(packet, TLSClientHello):
-                tls_hello = packet.getlayer(TLSClientHello)
-                if tls_hello and hasattr(tls_hello, 'servernames'):
-                    for name in tls_hello.servernames:
-                        if hasattr(name, 'servername'):
-                            sni = name.servername
-                            if isinstance(sni, bytes):
-                                sni = sni.decode('utf-8', errors='ignore')
-                            if sni and '.' in sni:
-                                return sni
-        except Exception:
-            pass
-
-        # Method 3: Raw packet inspection (fallback, optimized)
-        try:
-            # Only check TCP packets on common TLS ports
-            if not self._has_layer_cached(packet, TCP):
-                return None
-            
-            tcp = packet.getlayer(TCP)
-            if not tcp or tcp.dport not in [443, 8443, 993, 995]:  # Common TLS ports
-                return None
-            
-            # Use raw() method if available (zero-copy), fallback to bytes()
-            try:
-                raw = packet.raw if hasattr(packet, 'raw') else bytes(packet)
-            except Exception:
-                raw = bytes(packet)
-            # Look for TLS handshake (0x16) followed by ClientHello (0x01)
-            # Then look for SNI extension (0x0000)
-            tls_handshake = raw.find(b'\x16\x03')  # TLS handshake record
-            if tls_handshake == -1:
-                return None
-            
-            # Look for SNI extension type (0x0000) after handshake
-            sni_start = raw.find(b'\x00\x00', tls_handshake)
-            if sni_start == -1 or sni_start > len(raw) - 10:
-                return None
-            
-            # SNI structure: extension type (2) + length (2) + server name list length (2) + server name type (1) + server name length (2) + hostname
-            try:
-                name_list_len = int.from_bytes(raw[sni_start+2:sni_start+4], 'big')
-                if name_list_len < 3 or name_list_len > 256:
-                    return None
-                
-                name_type = raw[sni_start+4]
-                if name_type != 0:  # host_name type
-                    return None
-                
-                name_len = int.from_bytes(raw[sni_start+5:sni_start+7], 'big')
-                if name_len < 1 or name_len > 255:
-                    return None
-                
-                hostname = raw[sni_start+7:sni_start+7+name_len].decode('utf-8', errors='ignore')
-                if hostname and '.' in hostname and len(hostname) < 256:
-                    return hostname
-            except (IndexError, ValueError):
-                pass
-        except Exception:
-            pass
+    def _extract_tls_sni(self, payload: bytes) -> Optional[str]:
+        """Extract Server Name Indication (SNI) from a TLS ClientHello
 
-        return None
+        Args:
+            payload: Raw TCP payload
+        """
+        return parse_tls_sni(payload)
 
-    def _extract_http_info(self, packet) -> Dict[str, Optional[str]]:
-        """Extract HTTP information from packet (optimized)"""
+    def _extract_http_info(self, payload: bytes) -> Dict[str, Optional[str]]:
+        """Extract HTTP request information from the raw TCP payload"""
         result = {
             "method": None,
             "url": None,
@@ -429,135 +947,60 @@ class PacketCaptureService:
             "application": None
         }
 
-        # Early exit: Only check TCP packets on HTTP ports
-        if not self._has_layer_cached(packet, TCP):
-            return result
-        
-        tcp = packet.getlayer(TCP)
-        if not tcp or tcp.dport not in [80, 8080, 8000, 8888]:  # Common HTTP ports
-            return result
-
         try:
-            # Try Scapy HTTP layer first (most reliable)
-            if HTTPRequest and self._has_layer_cached(packet, HTTPRequest):
-                http = packet.getlayer(HTTPRequest)
-                if http:
-                    if hasattr(http, 'Method'):
-                        method = http.Method
-                        if isinstance(method, bytes):
-                            method = method.decode('utf-8', errors='ignore')
-                        result["method"] = method
-                    if hasattr(http, 'Path'):
-                        path = http.Path
-                        if isinstance(path, bytes):
-                            path = path.decode('utf-8', errors='ignore')
-                        result["url"] = path
-                    if hasattr(http, 'User_Agent'):
-                        ua = http.User_Agent
-                        if isinstance(ua, bytes):
-                            ua = ua.decode('utf-8', errors='ignore')
-                        result["user_agent"] = ua
-                    result["application"] = "HTTP"
-                    return result  # Early return if found
-
-            # Try raw packet inspection for HTTP (fallback, optimized)
-            # Use raw() method if available (zero-copy), fallback to bytes()
-            try:
-                raw = packet.raw if hasattr(packet, 'raw') else bytes(packet)
-            except Exception:
-                raw = bytes(packet)
-            if b'HTTP/' in raw or b'GET ' in raw or b'POST ' in raw:
+            # One match of the request line, then one search for
+            # User-Agent after it
+            request = _HTTP_REQUEST_RE.match(payload)
+            if request:
+                result["application"] = "HTTP"
+                result["method"] = request.group(1).decode('ascii')
+                result["url"] = request.group(2).decode('utf-8', errors='ignore')
+                user_agent = _HTTP_USER_AGENT_RE.search(payload, request.end())
+                if user_agent:
+                    result["user_agent"] = user_agent.group(1).strip().decode('utf-8', errors='ignore')
+            elif b'HTTP/' in payload:
                 result["application"] = "HTTP"
-                # Extract method
-                if raw.startswith(b'GET '):
-                    result["method"] = "GET"
-                elif raw.startswith(b'POST '):
-                    result["method"] = "POST"
-                elif raw.startswith(b'PUT '):
-                    result["method"] = "PUT"
-                elif raw.startswith(b'DELETE '):
-                    result["method"] = "DELETE"
-
-                # Extract URL
-                try:
-                    lines = raw.split(b'\r\n')
-                    if lines:
-                        first_line = lines[0].decode('utf-8', errors='ignore')
-                        parts = first_line.split(' ')
-                        if len(parts) > 1:
-                            result["url"] = parts[1]
-                except:
-                    pass
-
-                # Extract User-Agent
-                for line in raw.split(b'\r\n'):
-                    if line.startswith(b'User-Agent:'):
-                        ua = line.split(b':', 1)[1].strip().decode('utf-8', errors='ignore')
-                        result["user_agent"] = ua
-                        break
         except Exception as e:
             logger.debug(f"Error extracting HTTP info: {e}")
             pass
 
         return result
 
-    def _detect_application(self, packet, protocol: str, dst_port: int) -> Optional[str]:
-        """Detect application protocol from packet and port"""
+    def _detect_application(self, payload: bytes, protocol: str, dst_port: int) -> Optional[str]:
+        """Detect application protocol from L4 payload and port"""
         # Port-based detection
-        port_apps = {
-            80: "HTTP",
-            443: "HTTPS",
-            22: "SSH",
-            21: "FTP",
-            25: "SMTP",
-            53: "DNS",
-            110: "POP3",
-            143: "IMAP",
-            993: "IMAPS",
-            995: "POP3S",
-            3306: "MySQL",
-            5432: "PostgreSQL",
-            3389: "RDP",
-            5900: "VNC",
-        }
-
-        if dst_port in port_apps:
-            return port_apps[dst_port]
+        application = PORT_APPLICATIONS.get(dst_port)
+        if application is not None:
+            return application
 
         # Protocol-based detection
         if protocol == "HTTP":
             return "HTTP"
 
-        # Try to detect from packet content
-        try:
-            raw = bytes(packet)
-            if b'SSH-' in raw:
-                return "SSH"
-            elif b'FTP' in raw[:100]:
-                return "FTP"
-            elif b'SMTP' in raw[:100]:
-                return "SMTP"
-        except Exception:
-            pass
+        # Banner detection: SSH/FTP/SMTP are TCP protocols that announce
+        # themselves at the start of the stream
+        if protocol is not PROTO_TCP or not payload:
+            return None
+        head = payload[:100]
+        if b'SSH-' in head:
+            return "SSH"
+        elif b'FTP' in head:
+            return "FTP"
+        elif b'SMTP' in head:
+            return "SMTP"
 
         return None
 
-    def _extract_dns_details(self, packet) -> Dict[str, Optional[str]]:
+    def _extract_dns_details(self, dns: DNSMessage) -> Dict[str, Optional[str]]:
         """Extract detailed DNS information"""
         result = {
             "query_type": None,
             "response_code": None
         }
 
-        if not packet.haslayer(DNS):
-            return result
-
         try:
-            dns = packet[DNS]
-
             # Extract query type
-            if dns.qd:
-                query = dns.qd
+            if dns.qtype is not None:
                 query_types = {
                     1: "A",
                     2: "NS",
@@ -566,10 +1009,10 @@ class PacketCaptureService:
                     16: "TXT",
                     28: "AAAA",
                 }
-                result["query_type"] = query_types.get(query.qtype, f"TYPE{query.qtype}")
+                result["query_type"] = query_types.get(dns.qtype, f"TYPE{dns.qtype}")
 
             # Extract response code
-            if dns.qr == 1:  # Response
+            if dns.is_response:
                 response_codes = {
                     0: "NOERROR",
                     1: "FORMERR",
@@ -584,448 +1027,338 @@ class PacketCaptureService:
 
         return result
 
-    def _calculate_rtt(self, flow_key: str, timestamp: float) -> Optional[int]:
-        """Calculate round-trip time from packet timestamps"""
-        self._rtt_tracking[flow_key].append(timestamp)
-
-        # Keep only last 10 timestamps
-        if len(self._rtt_tracking[flow_key]) > 10:
-            self._rtt_tracking[flow_key] = self._rtt_tracking[flow_key][-10:]
+    def _calculate_rtt(self, timestamps: deque, timestamp_ns: int) -> Optional[int]:
+        """Calculate round-trip time from a flow's packet timestamps (nanoseconds)"""
+        # Bounded deque: the append drops the oldest timestamp
+        timestamps.append(timestamp_ns)
 
         # Simple RTT estimation: difference between consecutive packets
-        if len(self._rtt_tracking[flow_key]) >= 2:
-            timestamps = self._rtt_tracking[flow_key]
-            # Calculate average interval
-            intervals = [timestamps[i] - timestamps[i-1] for i in range(1, len(timestamps))]
-            if intervals:
-                avg_interval = sum(intervals) / len(intervals)
-                # RTT is roughly 2x the interval for bidirectional traffic
-                rtt_ms = int(avg_interval * 1000 * 2)
-                return max(1, min(rtt_ms, 10000))  # Clamp between 1ms and 10s
+        if len(timestamps) >= 2:
+            # Average interval (the sum of consecutive differences telescopes
+            # to last - first, so no per-packet interval list is needed);
+            # RTT is roughly 2x the interval for bidirectional traffic
+            rtt_ms = (timestamps[-1] - timestamps[0]) * 2 // ((len(timestamps) - 1) * 1_000_000)
+            return max(1, min(rtt_ms, 10000))  # Clamp between 1ms and 10s
 
         return None
 
-    def _calculate_jitter(self, flow_key: str, timestamp: float) -> Optional[float]:
-        """Calculate jitter (packet delay variation)"""
-        self._packet_timestamps[flow_key].append(timestamp)
-
-        # Keep only last 20 timestamps
-        if len(self._packet_timestamps[flow_key]) > 20:
-            self._packet_timestamps[flow_key] = self._packet_timestamps[flow_key][-20:]
-
-        if len(self._packet_timestamps[flow_key]) >= 2:
-            timestamps = self._packet_timestamps[flow_key]
-            # Calculate inter-packet delays
-            delays = [timestamps[i] - timestamps[i-1] for i in range(1, len(timestamps))]
-            if len(delays) >= 2:
-                # Jitter is the standard deviation of delays
-                mean_delay = sum(delays) / len(delays)
-                variance = sum((d - mean_delay) ** 2 for d in delays) / len(delays)
-                jitter = variance ** 0.5
-                return round(jitter * 1000, 2)  # Convert to milliseconds
+    def _calculate_jitter(self, window: DelayWindow, timestamp_ns: int) -> Optional[float]:
+        """Calculate jitter (packet delay variation) from a flow's delay window"""
+        window.add(timestamp_ns)
+
+        # Jitter is the standard deviation of the inter-packet delays
+        if len(window.delays) >= 2:
+            jitter = window.variance() ** 0.5
+            return round(jitter / 1_000_000, 2)  # Convert to milliseconds
 
         return None
 
-    def _detect_retransmission(self, packet, flow_key: str) -> bool:
-        """Detect TCP retransmissions"""
-        if not packet.haslayer(TCP):
+    def _detect_retransmission(self, tcp_seq: Optional[int], flow_key: FlowKey) -> bool:
+        """Detect TCP retransmissions from the TCP sequence number"""
+        if tcp_seq is None:
             return False
 
-        try:
-            tcp = packet[TCP]
-            seq_key = f"{flow_key}:{tcp.seq}"
-
-            if seq_key in self._retransmissions:
-                self._retransmissions[seq_key] += 1
-                return True
-            else:
-                self._retransmissions[seq_key] = 1
-                return False
-        except:
+        seq_key = (flow_key, tcp_seq)
+        count = self._retransmissions.get(seq_key)
+        if count is None:
+            self._retransmissions[seq_key] = 1
             return False
+        self._retransmissions[seq_key] = count + 1
+        return True
 
-    def _has_layer_cached(self, packet, layer_name: str) -> bool:
-        """Check if packet has layer (with caching for performance)"""
-        cache_key = f"{id(packet)}_{layer_name}"
-        if cache_key in self._layer_cache:
-            return self._layer_cache[cache_key]
-        
-        # Limit cache size
-        if len(self._layer_cache) > self._layer_cache_size:
-            # Clear 50% of cache (oldest entries)
-            keys_to_remove = list(self._layer_cache.keys())[:self._layer_cache_size // 2]
-            for key in keys_to_remove:
-                del self._layer_cache[key]
-        
-        has_layer = packet.haslayer(layer_name)
-        self._layer_cache[cache_key] = has_layer
-        return has_layer
-
-    async def _queue_packet(self, packet):
-        """Queue packet for batch processing (reduces async overhead)"""
-        async with self._packet_queue_lock:
-            self._packet_queue.append(packet)
-            # Process immediately if batch size reached
-            if len(self._packet_queue) >= self._packet_batch_size:
-                # Trigger processing (non-blocking)
-                asyncio.create_task(self._process_packet_batch())
-
-    async def _process_packet_queue(self):
-        """Process queued packets in batches"""
+    async def _drain_packet_queue(self):
+        """Drain packets handed off by the sniffer thread in batches"""
         while self._running:
             try:
-                await asyncio.sleep(0.01)  # 10ms batching window
-                await self._process_packet_batch()
+                try:
+                    await asyncio.wait_for(
+                        self._packet_event.wait(),
+                        timeout=self._packet_drain_interval
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                self._packet_event.clear()
+
+                while self._packet_queue:
+                    await self._process_packet_batch()
+                    # Yield between batches so API/WebSocket tasks stay responsive
+                    await asyncio.sleep(0)
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in packet queue processing: {e}")
 
     async def _process_packet_batch(self):
-        """Process a batch of queued packets"""
-        packets_to_process = []
-        async with self._packet_queue_lock:
-            if not self._packet_queue:
-                return
-            # Take up to batch_size packets
-            batch = self._packet_queue[:self._packet_batch_size]
-            self._packet_queue = self._packet_queue[self._packet_batch_size:]
-            packets_to_process = batch
-
-        # Process packets in batch (parallel where possible)
-        if packets_to_process:
-            # Process packets concurrently (but limit concurrency)
-            tasks = [self._process_packet(packet) for packet in packets_to_process]
-            await asyncio.gather(*tasks, return_exceptions=True)
-
-    async def _process_packet(self, packet):
-        """Process captured packet and extract flow information"""
+        """Dispatch up to one batch of parsed frames to their shards"""
+        queue = self._packet_queue
+        shard_queues = self._shard_queues
+        for _ in range(min(len(queue), self._packet_batch_size)):
+            raw, headers, shard, timestamp_ns = queue.popleft()
+            try:
+                shard_queues[shard].put_nowait((raw, headers, timestamp_ns))
+            except asyncio.QueueFull:
+                self._packets_dropped += 1
+
+    async def _shard_worker(self, queue: asyncio.Queue):
+        """Process the packets of one flow shard in arrival order"""
+        batch_size = self._packet_batch_size
+        while True:
+            # Wait for one packet, then take whatever else is already queued
+            burst = [await queue.get()]
+            while len(burst) < batch_size:
+                try:
+                    burst.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            for raw, headers, timestamp_ns in burst:
+                await self._process_packet(raw, headers, timestamp_ns)
+
+    async def _process_packet(self, raw: bytes, headers: PacketHeaders, timestamp_ns: int):
+        """Process a captured raw frame and extract flow information
+
+        Args:
+            raw: Raw Ethernet frame
+            headers: Parsed L2-L4 headers of the frame
+            timestamp_ns: Receive time of the frame (time_ns), taken on the
+                capture thread
+        """
         try:
-            # Early exit: Skip if packet is too small (likely malformed)
-            if len(packet) < 20:  # Minimum IP header size
+            # Handle ARP for device discovery (needs full Scapy dissection)
+            if headers.ethertype == ETH_P_ARP:
+                if self.device_service:
+                    await self.device_service.process_arp_packet(Ether(raw))
                 return
-            
-            # Extract IP layer (support both IPv4 and IPv6)
-            ip_layer = None
-            src_ip = None
-            dst_ip = None
-            ttl = None
-            
-            # Check IPv4 first (most common)
-            if self._has_layer_cached(packet, IP):
-                ip_layer = packet[IP]
-                src_ip = ip_layer.src
-                dst_ip = ip_layer.dst
-                ttl = ip_layer.ttl
-            # Check IPv6 if enabled
-            elif self._enable_ipv6 and IPv6 and self._has_layer_cached(packet, IPv6):
-                ip_layer = packet[IPv6]
-                src_ip = ip_layer.src
-                dst_ip = ip_layer.dst
-                ttl = ip_layer.hlim  # IPv6 uses hop limit instead of TTL
-            else:
-                return  # Not an IP packet we care about
-            
+
+            if headers.ethertype == ETH_P_IPV6 and not self._enable_ipv6:
+                return
+
+            src_ip = headers.src_ip
+            dst_ip = headers.dst_ip
+            ttl = headers.ttl
+
             # Skip localhost traffic if configured
             if self._skip_local_traffic and (src_ip.startswith("127.") or dst_ip.startswith("127.")):
                 return
 
-            # Determine protocol and ports (optimized layer checks)
-            protocol = "OTHER"
-            src_port = 0
-            dst_port = 0
-            tcp_flags = None
-            connection_state = None
-
-            # Use cached layer checks for better performance
-            if self._has_layer_cached(packet, TCP):
-                protocol = "TCP"
-                tcp_layer = packet.getlayer(TCP)  # More efficient than [TCP]
-                if tcp_layer:
-                    src_port = tcp_layer.sport
-                    dst_port = tcp_layer.dport
-                    tcp_flags = self._extract_tcp_flags_fast(tcp_layer)
-            elif self._has_layer_cached(packet, UDP):
-                protocol = "UDP"
-                udp_layer = packet.getlayer(UDP)
-                if udp_layer:
-                    src_port = udp_layer.sport
-                    dst_port = udp_layer.dport
-            elif self._has_layer_cached(packet, ICMP):
-                protocol = "ICMP"
-            elif self._has_layer_cached(packet, ARP):
-                protocol = "ARP"
-                # Handle ARP for device discovery
-                if self.device_service:
-                    await self.device_service.process_arp_packet(packet)
-                return
-            else:
+            protocol = _PROTOCOL_TABLE[headers.ip_proto]
+            if protocol is None:
                 return  # Unsupported protocol
+            src_port = headers.src_port
+            dst_port = headers.dst_port
+            tcp_flags = 0
+            if protocol is PROTO_TCP:
+                tcp_flags = headers.tcp_flags & TCP_FLAG_MASK
 
             # Skip if no valid ports
-            if protocol in ["TCP", "UDP"] and (src_port == 0 or dst_port == 0):
+            if (protocol is PROTO_TCP or protocol is PROTO_UDP) and (src_port == 0 or dst_port == 0):
                 return
 
-            # Create flow key (optimized with caching)
-            flow_tuple = (src_ip, src_port, dst_ip, dst_port, protocol)
-            reverse_tuple = (dst_ip, dst_port, src_ip, src_port, protocol)
-            
-            # Use cached flow keys to avoid string concatenation
-            if flow_tuple in self._flow_key_cache:
-                flow_key = self._flow_key_cache[flow_tuple]
-            else:
-                flow_key = f"{src_ip}:{src_port}-{dst_ip}:{dst_port}-{protocol}"
-                if len(self._flow_key_cache) < self._flow_key_cache_size:
-                    self._flow_key_cache[flow_tuple] = flow_key
-            
-            if reverse_tuple in self._flow_key_cache:
-                reverse_key = self._flow_key_cache[reverse_tuple]
+            # Direction-independent flow key (lower endpoint first), so both
+            # directions of a connection hit the same entry in one lookup
+            if (src_ip, src_port) <= (dst_ip, dst_port):
+                flow_key = (src_ip, src_port, dst_ip, dst_port, protocol)
             else:
-                reverse_key = f"{dst_ip}:{dst_port}-{src_ip}:{src_port}-{protocol}"
-                if len(self._flow_key_cache) < self._flow_key_cache_size:
-                    self._flow_key_cache[reverse_tuple] = reverse_key
+                flow_key = (dst_ip, dst_port, src_ip, src_port, protocol)
 
             # Get packet size
-            packet_size = len(packet)
-            timestamp_ms = int(datetime.now().timestamp() * 1000)
-            timestamp_sec = datetime.now().timestamp()
+            packet_size = len(raw)
+            # Wall-clock ms for flow timestamps; RTT/jitter intervals use the
+            # integer nanoseconds directly
+            timestamp_ms = timestamp_ns // 1_000_000
 
             # Determine direction (incoming vs outgoing) - cached
-            is_incoming = self._is_local_ip_cached(dst_ip)
-
-            # Determine source device (cached to reduce async overhead)
-            device_id = await self._get_or_create_device_cached(src_ip, packet)
-
-            # Extract domain from DNS (if available) - do this outside lock
-            domain = await self._extract_domain_from_packet(packet, dst_ip)
-
-            # Extract TLS SNI
-            sni = self._extract_tls_sni(packet)
-
-            # Extract HTTP information
-            http_info = self._extract_http_info(packet)
-
-            # Extract DNS details
-            dns_details = self._extract_dns_details(packet)
+            is_incoming = is_local_ip(dst_ip)
+
+            # Determine source device; only a cache miss awaits the database
+            device_id = self._cached_device_id(src_ip)
+            if device_id is None:
+                device_id = await self._get_or_create_device_cached(src_ip, raw)
+
+            # Find the flow. There is no await from here to the last update,
+            # so no lock is needed: nothing else runs on the loop meanwhile,
+            # and shard workers never share a flow
+            flow = self._active_flows.get(flow_key)
+            on_probation = flow is None
+            if on_probation:
+                flow = self._new_flows.get(flow_key)
+
+            payload = raw[headers.payload_offset:headers.payload_end]
+
+            # DNS is parsed straight from the payload bytes
+            dns = None
+            if payload and (src_port == DNS_PORT or dst_port == DNS_PORT):
+                dns = parse_dns(payload, tcp=protocol is PROTO_TCP)
+                # None for payloads that aren't a whole DNS message (TCP
+                # continuation segments, truncated or non-DNS traffic)
+                if dns is not None:
+                    self._cache_dns_answers(dns)
+
+            # Destination domain (flows that already have one skip the lookup)
+            domain = None
+            if flow is None or not flow.domain:
+                domain = self._lookup_domain(dst_ip)
+
+            sni = None
+            http_info = {}
+            dns_details = {}
+            if payload and protocol is PROTO_TCP and dst_port in TLS_PORTS:
+                # Extract TLS SNI (the ClientHello is sent once per flow)
+                if flow is None or not flow.sni:
+                    sni = self._extract_tls_sni(payload)
+            elif payload and protocol is PROTO_TCP and dst_port in HTTP_PORTS:
+                # Extract HTTP information
+                http_info = self._extract_http_info(payload)
+            elif dns is not None:
+                # Extract DNS details
+                dns_details = self._extract_dns_details(dns)
+
+            # Detect application (payload scans stop once the flow has one)
+            application = None
+            if flow is None or not flow.application:
+                application = self._detect_application(payload, protocol, dst_port) or http_info.get("application")
+
+            # Only segments that consume sequence space can be retransmitted;
+            # pure ACKs repeat the same sequence number by design
+            is_retransmission = False
+            if payload or tcp_flags & (TCP_SYN | TCP_FIN):
+                is_retransmission = self._detect_retransmission(headers.tcp_seq, flow_key)
+
+            if flow is None:
+                # Create new flow
+                flow = ActiveFlow(
+                    f"{self._flow_id_prefix}-{next(self._flow_id_counter):x}",
+                    src_ip, src_port, dst_ip, dst_port, protocol,
+                    device_id, timestamp_ns, ttl,
+                )
+                self._new_flows[flow_key] = flow
+                self.flows_detected += 1
+            else:
+                flow.last_seen = timestamp_ms
+                # Update TTL (use minimum for OS fingerprinting)
+                if flow.ttl is None or (ttl is not None and ttl < flow.ttl):
+                    flow.ttl = ttl
+                if flow.delays is None:
+                    flow.start_trackers()
+
+            if is_incoming:
+                flow.bytes_in += packet_size
+                flow.packets_in += 1
+            else:
+                flow.bytes_out += packet_size
+                flow.packets_out += 1
 
-            # Detect application
-            application = self._detect_application(packet, protocol, dst_port) or http_info.get("application")
+            if on_probation and flow.packets_in + flow.packets_out >= self._flow_promotion_packets:
+                del self._new_flows[flow_key]
+                self._active_flows[flow_key] = flow
 
-            # Calculate network quality metrics
-            rtt = self._calculate_rtt(flow_key, timestamp_sec)
-            jitter = self._calculate_jitter(flow_key, timestamp_sec)
-            is_retransmission = self._detect_retransmission(packet, flow_key)
+            if is_retransmission:
+                flow.retransmissions += 1
 
-            # Update connection state
-            if tcp_flags:
-                current_state = self._connection_states.get(flow_key)
-                connection_state = self._get_connection_state(tcp_flags, current_state)
-                self._connection_states[flow_key] = connection_state
-
-            # Thread-safe access to active flows
-            async with self._flows_lock:
-                # Find or create flow
-                flow_data = self._active_flows.get(flow_key) or self._active_flows.get(reverse_key)
-
-                if flow_data:
-                    # Update existing flow
-                    if is_incoming:
-                        flow_data["bytes_in"] += packet_size
-                        flow_data["packets_in"] += 1
-                    else:
-                        flow_data["bytes_out"] += packet_size
-                        flow_data["packets_out"] += 1
-                    flow_data["last_seen"] = timestamp_ms
-                    flow_data["duration"] = timestamp_ms - flow_data["first_seen"]
-
-                    # Update retransmission count
-                    if is_retransmission:
-                        flow_data["retransmissions"] = flow_data.get("retransmissions", 0) + 1
-
-                    # Update domain/SNI if found
-                    if domain:
-                        flow_data["domain"] = domain
-                    if sni:
-                        flow_data["sni"] = sni
-
-                    # Update application if detected
-                    if application:
-                        flow_data["application"] = application
-
-                    # Update HTTP info
-                    if http_info.get("method"):
-                        flow_data["http_method"] = http_info["method"]
-                    if http_info.get("url"):
-                        flow_data["url"] = http_info["url"]
-                    if http_info.get("user_agent"):
-                        flow_data["user_agent"] = http_info["user_agent"]
-
-                    # Update DNS details
-                    if dns_details.get("query_type"):
-                        flow_data["dns_query_type"] = dns_details["query_type"]
-                    if dns_details.get("response_code"):
-                        flow_data["dns_response_code"] = dns_details["response_code"]
-
-                    # Update TCP flags and state
-                    if tcp_flags:
-                        if "tcp_flags" not in flow_data:
-                            flow_data["tcp_flags"] = []
-                        # Merge flags (keep unique)
-                        existing_flags = set(flow_data["tcp_flags"])
-                        existing_flags.update(tcp_flags)
-                        flow_data["tcp_flags"] = list(existing_flags)
-
-                    if connection_state:
-                        flow_data["connection_state"] = connection_state
-
-                    # Update TTL (use minimum for OS fingerprinting)
-                    if "ttl" not in flow_data or ttl < flow_data["ttl"]:
-                        flow_data["ttl"] = ttl
-
-                    # Update RTT and jitter
-                    if rtt:
-                        if "rtt" not in flow_data:
-                            flow_data["rtt"] = []
-                        flow_data["rtt"].append(rtt)
-                        # Keep only last 5 RTT measurements
-                        if len(flow_data["rtt"]) > 5:
-                            flow_data["rtt"] = flow_data["rtt"][-5:]
-
-                    if jitter is not None:
-                        flow_data["jitter"] = jitter
-                else:
-                    # Create new flow
-                    flow_data = {
-                        "id": str(uuid.uuid4()),
-                        "source_ip": src_ip,
-                        "source_port": src_port,
-                        "dest_ip": dst_ip,
-                        "dest_port": dst_port,
-                        "protocol": protocol,
-                        "bytes_in": packet_size if is_incoming else 0,
-                        "bytes_out": packet_size if not is_incoming else 0,
-                        "packets_in": 1 if is_incoming else 0,
-                        "packets_out": 1 if not is_incoming else 0,
-                        "first_seen": timestamp_ms,
-                        "last_seen": timestamp_ms,
-                        "duration": 0,
-                        "device_id": device_id,
-                        "status": "active",
-                        "ttl": ttl,
-                        "retransmissions": 1 if is_retransmission else 0,
-                    }
-
-                    if domain:
-                        flow_data["domain"] = domain
-                    if sni:
-                        flow_data["sni"] = sni
-                    if application:
-                        flow_data["application"] = application
-                    if tcp_flags:
-                        flow_data["tcp_flags"] = tcp_flags
-                    if connection_state:
-                        flow_data["connection_state"] = connection_state
-                    if http_info.get("method"):
-                        flow_data["http_method"] = http_info["method"]
-                    if http_info.get("url"):
-                        flow_data["url"] = http_info["url"]
-                    if http_info.get("user_agent"):
-                        flow_data["user_agent"] = http_info["user_agent"]
-                    if dns_details.get("query_type"):
-                        flow_data["dns_query_type"] = dns_details["query_type"]
-                    if dns_details.get("response_code"):
-                        flow_data["dns_response_code"] = dns_details["response_code"]
-                    if rtt:
-                        flow_data["rtt"] = [rtt]
-                    if jitter is not None:
-                        flow_data["jitter"] = jitter
-
-                    self._active_flows[flow_key] = flow_data
-                    self.flows_detected += 1
-
-            # Cache domain outside of flows lock to avoid deadlock
+            # Update domain/SNI if found
             if domain:
-                async with self._dns_cache_lock:
-                    self._dns_cache[dst_ip] = domain
+                flow.domain = domain
+            if sni:
+                flow.sni = sni
+
+            # Update application if detected
+            if application:
+                flow.application = application
+
+            # Update HTTP info
+            if http_info.get("method"):
+                flow.http_method = http_info["method"]
+            if http_info.get("url"):
+                flow.url = http_info["url"]
+            if http_info.get("user_agent"):
+                flow.user_agent = http_info["user_agent"]
+
+            # Update DNS details
+            if dns_details.get("query_type"):
+                flow.dns_query_type = dns_details["query_type"]
+            if dns_details.get("response_code"):
+                flow.dns_response_code = dns_details["response_code"]
+
+            # Merge TCP flags (bitmask, names are built at finalize)
+            flow.tcp_flags |= tcp_flags
+            if tcp_flags:
+                flow.connection_state = self._get_connection_state(tcp_flags, flow.connection_state)
+
+            # Network quality metrics (none until a flow's second packet);
+            # keep only the last 5 RTT measurements
+            if flow.delays is not None:
+                rtt = self._calculate_rtt(flow.packet_times, timestamp_ns)
+                if rtt:
+                    if flow.rtt is None:
+                        flow.rtt = deque(maxlen=5)
+                    flow.rtt.append(rtt)
+                jitter = self._calculate_jitter(flow.delays, timestamp_ns)
+                if jitter is not None:
+                    flow.jitter = jitter
+
+            # Flows pushed out of the LRU table by this insert
+            evicted_flows = self._evicted_flows
+            if evicted_flows:
+                self._evicted_flows = []
+
+            # Finalize evicted flows
+            for evicted_key, evicted_data in evicted_flows:
+                await self._finalize_flow(evicted_key, evicted_data)
 
         except Exception as e:
             logger.error(f"Error processing packet: {e}")
 
-    async def _flush_write_queue(self):
-        """Flush queued flows to database in batch (Pi optimization)"""
-        if not self._write_queue or not self.storage:
+    async def _write_flow_batch(self, flows: List[NetworkFlow]):
+        """Save a batch of finalized flows and notify clients once"""
+        if not flows:
             return
-
-        flows_to_write = []
-        async with self._write_queue_lock:
-            flows_to_write = self._write_queue[:self._batch_size]
-            self._write_queue = self._write_queue[self._batch_size:]
-            self._last_batch_write = datetime.now().timestamp()
-
-        # Batch write to database
-        if flows_to_write:
+        if self.storage:
             try:
-                await self.storage.add_flows_batch(flows_to_write)
-                logger.debug(f"Batch wrote {len(flows_to_write)} flows to database")
+                await self.storage.add_flows_batch(flows)
+                logger.debug(f"Batch wrote {len(flows)} flows to database")
             except Exception as e:
                 logger.error(f"Error in batch write: {e}")
 
-    async def _batch_write_loop(self):
-        """Periodic batch write loop (Pi optimization)"""
-        while self._running:
+        if self.on_flow_update:
             try:
-                await asyncio.sleep(self._batch_interval)
-                current_time = datetime.now().timestamp()
-                
-                # Flush if interval elapsed
-                if current_time - self._last_batch_write >= self._batch_interval:
-                    await self._flush_write_queue()
-            except asyncio.CancelledError:
-                break
+                # Models are passed as-is: they are only serialized (once)
+                # if a client is listening
+                await self.on_flow_update({
+                    "type": "flow_batch",
+                    "flows": flows
+                })
             except Exception as e:
-                logger.error(f"Error in batch write loop: {e}")
-
-    async def _cleanup_old_flows(self):
-        """Cleanup old flows to prevent memory exhaustion (Pi optimization)"""
-        current_time = datetime.now().timestamp() * 1000
-        timeout_ms = 300000  # 5 minutes
-        
-        flows_to_remove = []
-        for flow_key, flow_data in self._active_flows.items():
-            last_seen = flow_data.get("last_seen", 0)
-            if current_time - last_seen > timeout_ms:
-                flows_to_remove.append(flow_key)
-        
-        # Remove old flows (limit to 20% to avoid blocking)
-        remove_count = min(len(flows_to_remove), self._max_active_flows // 5)
-        for flow_key in flows_to_remove[:remove_count]:
-            flow_data = self._active_flows.get(flow_key)
-            if flow_data:
-                await self._finalize_flow(flow_key, flow_data)
-        
-        # Cleanup tracking data
-        self._cleanup_tracking_data()
-
-    def _cleanup_tracking_data(self):
-        """Cleanup tracking data structures to prevent memory growth (Pi optimization)"""
-        # Limit DNS cache
-        if len(self._dns_cache) > self._max_dns_cache_size:
-            # Remove oldest 20%
-            items_to_remove = list(self._dns_cache.keys())[:self._max_dns_cache_size // 5]
-            for key in items_to_remove:
-                del self._dns_cache[key]
-        
-        # Limit RTT tracking
-        if len(self._rtt_tracking) > self._max_rtt_tracking_size:
-            items_to_remove = list(self._rtt_tracking.keys())[:self._max_rtt_tracking_size // 5]
-            for key in items_to_remove:
-                del self._rtt_tracking[key]
-        
-        # Limit retransmission tracking
-        if len(self._retransmissions) > self._max_retransmission_tracking:
-            items_to_remove = list(self._retransmissions.keys())[:self._max_retransmission_tracking // 5]
-            for key in items_to_remove:
-                del self._retransmissions[key]
+                logger.error(f"Error notifying flow batch: {e}")
+
+    async def _flush_worker(self):
+        """Analyze and write finalized flows in batches as they arrive"""
+        queue = self._write_queue
+        while True:
+            # Whatever queued up while the previous batch was being written
+            # goes out together
+            batch = [await queue.get()]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                flows = []
+                for flow in batch:
+                    try:
+                        flows.append(await self._to_network_flow(flow))
+                    except Exception as e:
+                        logger.error(f"Error finalizing flow {flow.id}: {e}")
+                await self._write_flow_batch(flows)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+            # Grow batches while the writer is falling behind (fewer, larger
+            # transactions), shrink them again once it keeps up
+            if queue.qsize() >= self._batch_size:
+                self._batch_size = min(self._batch_size * 2, self._max_batch_size)
+            elif len(batch) < self._batch_size:
+                self._batch_size = max(self._batch_size // 2, self._min_batch_size)
 
     async def _periodic_cleanup(self):
         """Periodic cleanup of old flows and memory management (Pi optimization)"""
@@ -1035,18 +1368,26 @@ class PacketCaptureService:
                 if not self._running:
                     break
 
-                current_time = int(datetime.now().timestamp() * 1000)
-                inactive_flows = []
+                # Flows inactive for more than 60 seconds
+                cutoff = time_ns() // 1_000_000 - 60000
 
-                # Thread-safe access to find inactive flows
-                async with self._flows_lock:
-                    # Find flows inactive for more than 60 seconds
-                    for flow_key, flow_data in self._active_flows.items():
-                        if current_time - flow_data["last_seen"] > 60000:
-                            # Create a copy of flow_data to avoid holding lock during finalization
-                            inactive_flows.append((flow_key, flow_data.copy()))
-
-                # Finalize inactive flows (outside lock to avoid blocking)
+                # Detach inactive flows (no await, so packets can't interleave);
+                # once removed from the table they can be finalized without
+                # copying, and late packets simply start a new flow
+                inactive_flows = []
+                for flow_table in (self._new_flows, self._active_flows):
+                    # The LRU tables are in last-packet order, oldest first,
+                    # so the sweep stops at the first flow that is still live
+                    stale_keys = []
+                    for flow_key, flow_data in flow_table.items():
+                        if flow_data.last_seen >= cutoff:
+                            break
+                        stale_keys.append(flow_key)
+                    inactive_flows.extend(
+                        (flow_key, flow_table.pop(flow_key)) for flow_key in stale_keys
+                    )
+
+                # Finalize inactive flows
                 for flow_key, flow_data in inactive_flows:
                     await self._finalize_flow(flow_key, flow_data)
 
@@ -1057,14 +1398,11 @@ class PacketCaptureService:
 
     async def _finalize_all_flows(self):
         """Finalize all active flows (called on shutdown)"""
-        # Get a snapshot of all flows while holding the lock
-        flows_to_finalize = []
-        async with self._flows_lock:
-            for flow_key, flow_data in self._active_flows.items():
-                # Create a copy to avoid holding lock during finalization
-                flows_to_finalize.append((flow_key, flow_data.copy()))
-
-        # Finalize flows outside lock to avoid blocking
+        # Detach all flows, then finalize them
+        flows_to_finalize = list(self._new_flows.items()) + list(self._active_flows.items())
+        self._new_flows.clear()
+        self._active_flows.clear()
+
         for flow_key, flow_data in flows_to_finalize:
             try:
                 await self._finalize_flow(flow_key, flow_data)
@@ -1073,277 +1411,212 @@ class PacketCaptureService:
                     f"Error finalizing flow {flow_key}: {e}"
                 )
 
-    async def _extract_domain_from_packet(self, packet, ip: str) -> Optional[str]:
-        """Extract domain name from DNS packet or use cache"""
-        # Check DNS cache first (thread-safe)
-        async with self._dns_cache_lock:
-            if ip in self._dns_cache:
-                cached = self._dns_cache[ip]
-                # Return None if cached as empty string (failed lookup)
-                return cached if cached else None
-
-        # Try to extract from DNS response packet
-        if packet.haslayer(DNS):
-            dns = packet[DNS]
-            # DNS response (qr=1)
-            if dns.qr == 1 and dns.an:
-                # Check if this is a response for the IP we're interested in
-                for i in range(dns.ancount):
-                    if dns.an[i].type == 1:  # A record
-                        response_ip = dns.an[i].rdata
-                        if response_ip == ip and dns.qd:
-                            # Get the queried domain name
-                            query_name = dns.qd.qname.decode('utf-8').rstrip('.')
-                            async with self._dns_cache_lock:
-                                self._dns_cache[ip] = query_name
-                            
-                            # Track DNS query for enhanced identification
-                            if self.enhanced_identification:
-                                self.enhanced_identification.track_dns_query(query_name, ip)
-                            
-                            return query_name
-                # Check for CNAME records
-                for i in range(dns.ancount):
-                    if dns.an[i].type == 5:  # CNAME record
-                        if dns.qd:
-                            query_name = dns.qd.qname.decode('utf-8').rstrip('.')
-                            async with self._dns_cache_lock:
-                                self._dns_cache[ip] = query_name
-                            
-                            # Track DNS query for enhanced identification
-                            if self.enhanced_identification:
-                                self.enhanced_identification.track_dns_query(query_name, ip)
-                            
-                            return query_name
-
-        # Try reverse DNS lookup for destination IP
-        # (if not already cached)
-        if ip not in self._dns_cache:
+    def _cache_dns_answers(self, dns: DNSMessage):
+        """Map every address answered by a DNS response to the queried name"""
+        if not (dns.is_response and dns.qname and dns.addresses):
+            return
+
+        query_name = dns.qname
+        for address in dns.addresses:
+            self._dns_cache[address] = query_name
+
+        # Track DNS query for enhanced identification
+        if self.enhanced_identification:
+            for address in dns.addresses:
+                self.enhanced_identification.track_dns_query(query_name, address)
+
+    def _lookup_domain(self, ip: str) -> Optional[str]:
+        """Domain for an address from the DNS cache
+
+        Unknown non-local addresses are queued for a background reverse
+        lookup; the flow picks up the result from the cache at flush time.
+        """
+        cached = self._dns_cache.get(ip, _NOT_CACHED)
+        if cached is not _NOT_CACHED:
+            if cached:
+                return cached
+            if cached is None:
+                return None  # Reverse lookup pending
+            if monotonic() < self._dns_retry_at.get(ip, 0.0):
+                return None  # Lookup failed recently
+
+        if not is_local_ip(ip):
             try:
-                import socket
-                # Only do reverse lookup for non-local IPs
-                if not self._is_local_ip(ip):
-                    hostname = socket.gethostbyaddr(ip)[0]
-                    if hostname and hostname != ip:
-                        domain = (
-                            hostname.split('.')[0]
-                            if '.' in hostname
-                            else hostname
-                        )
-                        async with self._dns_cache_lock:
-                            self._dns_cache[ip] = domain
-                        return domain
-            except (socket.herror, socket.gaierror, OSError):
-                # Reverse DNS lookup failed,
-                # cache empty string to avoid retrying
-                async with self._dns_cache_lock:
-                    self._dns_cache[ip] = ""
+                self._resolve_queue.put_nowait(ip)
+                self._dns_cache[ip] = None  # Pending marker
+            except asyncio.QueueFull:
+                pass  # Resolver backlog full, retry on a later packet
 
         return None
 
-    def _is_local_ip_cached(self, ip: str) -> bool:
-        """Check if IP is local/private (cached for performance)"""
-        # Cache local IP checks (most IPs are repeated)
-        if ip in self._device_cache:
-            # Use device cache as local IP cache too (if cached, it's local)
-            return True
-        
-        return self._is_local_ip(ip)
-
-    async def _get_or_create_device_cached(self, ip: str, packet) -> str:
-        """Get or create device from IP address (with caching)"""
+    async def _reverse_dns_worker(self):
+        """Resolve queued IPs to hostnames without blocking packet processing"""
+        loop = asyncio.get_running_loop()
+        while True:
+            ip = await self._resolve_queue.get()
+            try:
+                hostname, _ = await asyncio.wait_for(
+                    loop.run_in_executor(
+                        self._resolver_executor, socket.getnameinfo, (ip, 0), socket.NI_NAMEREQD
+                    ),
+                    timeout=self._reverse_dns_timeout
+                )
+                domain = ""
+                if hostname and hostname != ip:
+                    domain = hostname.split('.')[0] if '.' in hostname else hostname
+            except (asyncio.TimeoutError, OSError):
+                # Reverse DNS lookup failed, cache empty string so it is
+                # not retried until the failure TTL runs out
+                domain = ""
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"Reverse DNS lookup failed for {ip}: {e}")
+                domain = ""
+            finally:
+                self._resolve_queue.task_done()
+
+            # Don't overwrite a domain learned from DNS traffic meanwhile
+            if not self._dns_cache.get(ip):
+                self._dns_cache[ip] = domain
+                if not domain:
+                    self._dns_retry_at[ip] = monotonic() + self._dns_failure_ttl
+
+    def _cached_device_id(self, ip: str) -> Optional[str]:
+        """Device ID from the cache, or None if missing or expired"""
         if not self.device_service:
             return "unknown"
 
-        # Check cache first (avoid async database call)
-        current_time = datetime.now().timestamp()
-        if ip in self._device_cache:
-            cache_time = self._device_cache_ttl.get(ip, 0)
-            if current_time - cache_time < self._device_cache_max_age:
-                return self._device_cache[ip]
+        cached = self._device_cache.get(ip)
+        if cached is not None:
+            device_id, expires_at = cached
+            if monotonic() < expires_at:
+                return device_id
             # Cache expired, remove it
-            del self._device_cache[ip]
-            if ip in self._device_cache_ttl:
-                del self._device_cache_ttl[ip]
+            self._device_cache.pop(ip, None)
+        return None
 
-        # Extract MAC from Ethernet layer (optimized)
-        mac = None
-        if self._has_layer_cached(packet, Ether):
-            ether = packet.getlayer(Ether)
-            if ether:
-                mac = ether.src
+    async def _get_or_create_device_cached(self, ip: str, raw: bytes) -> str:
+        """Get or create device from IP address (with caching)"""
+        # Check cache first (avoid async database call)
+        device_id = self._cached_device_id(ip)
+        if device_id is not None:
+            return device_id
+
+        # Shards missing the same IP concurrently share one database lookup
+        # (and don't race each other into creating duplicate devices)
+        lookup = self._device_lookups.get(ip)
+        if lookup is None:
+            lookup = asyncio.ensure_future(self._lookup_device(ip, raw))
+            self._device_lookups[ip] = lookup
+            lookup.add_done_callback(lambda _: self._device_lookups.pop(ip, None))
+        return await asyncio.shield(lookup)
+
+    async def _lookup_device(self, ip: str, raw: bytes) -> str:
+        """Get or create the device for an IP in storage and cache its ID"""
+        # Source MAC straight from the Ethernet header
+        mac = raw[6:12].hex(":")
 
         # Get or create device (async database call)
-        device = await self.device_service.get_or_create_device(ip, mac, packet)
+        device = await self.device_service.get_or_create_device(ip, mac)
         device_id = device.id
 
-        # Update cache
-        self._device_cache[ip] = device_id
-        self._device_cache_ttl[ip] = current_time
-
-        # Limit cache size
-        if len(self._device_cache) > self._max_dns_cache_size:
-            # Remove oldest 20%
-            items_to_remove = list(self._device_cache.keys())[:self._max_dns_cache_size // 5]
-            for key in items_to_remove:
-                del self._device_cache[key]
-                if key in self._device_cache_ttl:
-                    del self._device_cache_ttl[key]
+        # Update cache (LRU evicts the least recently used IP past the limit)
+        self._device_cache[ip] = (device_id, monotonic() + self._device_cache_max_age)
 
         return device_id
 
-    async def _get_or_create_device(self, ip: str, packet) -> str:
+    async def _get_or_create_device(self, ip: str, raw: bytes) -> str:
         """Get or create device from IP address (legacy method, use cached version)"""
-        return await self._get_or_create_device_cached(ip, packet)
+        return await self._get_or_create_device_cached(ip, raw)
 
-    def _is_local_ip(self, ip: str) -> bool:
-        """Check if IP is local/private"""
-        try:
-            socket.inet_aton(ip)
-            # Private IP ranges
-            return (
-                ip.startswith("192.168.") or
-                ip.startswith("10.") or
-                ip.startswith("172.16.") or
-                ip.startswith("127.") or
-                ip.startswith("169.254.")  # Link-local
-            )
-        except (socket.error, OSError):
-            return False
+    async def _finalize_flow(self, flow_key: FlowKey, flow: ActiveFlow):
+        """Finalize and save a flow already detached from the flow tables
 
-    async def _finalize_flow(self, flow_key: str, flow_data: dict):
-        """Finalize and save flow"""
+        Threat analysis, enrichment and storage happen on the flush worker,
+        so finalizing never waits on the database.
+        """
         try:
-            # Determine threat level
-            threat_level = "safe"
-            if self.threat_service:
-                threat_level = await self.threat_service.analyze_flow(flow_data)
-
-            # Get domain from cache or flow data
-            domain = (
-                flow_data.get("domain") or
-                self._dns_cache.get(flow_data["dest_ip"])
-            )
-
-            # Get SNI if available
-            sni = flow_data.get("sni")
-
-            # Get geolocation for destination IP
-            country = None
-            city = None
-            asn = None
-            if self.geolocation_service:
-                geo_info = self.geolocation_service.get_location(flow_data["dest_ip"])
-                country = geo_info.get("country")
-                city = geo_info.get("city")
-                asn = geo_info.get("asn")
-
-            # Calculate average RTT
-            rtt = None
-            if "rtt" in flow_data and flow_data["rtt"]:
-                rtt_list = flow_data["rtt"]
-                if isinstance(rtt_list, list) and len(rtt_list) > 0:
-                    rtt = int(sum(rtt_list) / len(rtt_list))
-                elif isinstance(rtt_list, (int, float)):
-                    rtt = int(rtt_list)
-
-            # Get retransmission count
-            retransmissions = flow_data.get("retransmissions", 0)
-            # Ensure retransmissions is an integer (in case it was set as a list)
-            if isinstance(retransmissions, list):
-                retransmissions = len(retransmissions) if retransmissions else 0
-            elif not isinstance(retransmissions, (int, float)):
-                retransmissions = 0
-            retransmissions = int(retransmissions)
-
-            # Get jitter
-            jitter = flow_data.get("jitter")
-
-            # Get TCP flags
-            tcp_flags = flow_data.get("tcp_flags")
-
-            # Get connection state
-            connection_state = flow_data.get("connection_state")
-
-            # Get TTL
-            ttl = flow_data.get("ttl")
-
-            # Get application
-            application = flow_data.get("application")
-
-            # Get HTTP info
-            user_agent = flow_data.get("user_agent")
-            http_method = flow_data.get("http_method")
-            url = flow_data.get("url")
-
-            # Get DNS details
-            dns_query_type = flow_data.get("dns_query_type")
-            dns_response_code = flow_data.get("dns_response_code")
-
-            # Create NetworkFlow object
-            flow = NetworkFlow(
-                id=flow_data["id"],
-                timestamp=flow_data["first_seen"],
-                sourceIp=flow_data["source_ip"],
-                sourcePort=flow_data["source_port"],
-                destIp=flow_data["dest_ip"],
-                destPort=flow_data["dest_port"],
-                protocol=flow_data["protocol"],
-                bytesIn=flow_data["bytes_in"],
-                bytesOut=flow_data["bytes_out"],
-                packetsIn=flow_data["packets_in"],
-                packetsOut=flow_data["packets_out"],
-                duration=flow_data["duration"],
-                status="closed",
-                threatLevel=threat_level,
-                deviceId=flow_data["device_id"],
-                domain=domain if domain else None,
-                sni=sni,
-                country=country,
-                city=city,
-                asn=asn,
-                tcpFlags=tcp_flags,
-                ttl=ttl,
-                connectionState=connection_state,
-                rtt=rtt,
-                retransmissions=retransmissions if retransmissions > 0 else None,
-                jitter=jitter,
-                application=application,
-                userAgent=user_agent,
-                httpMethod=http_method,
-                url=url,
-                dnsQueryType=dns_query_type,
-                dnsResponseCode=dns_response_code
-            )
-
-            # Queue for batch write (Pi optimization)
-            if self.storage:
-                async with self._write_queue_lock:
-                    self._write_queue.append(flow)
-                    # Flush if batch size reached
-                    if len(self._write_queue) >= self._batch_size:
-                        await self._flush_write_queue()
-
-            # Notify clients
-            if self.on_flow_update:
-                await self.on_flow_update({
-                    "type": "flow_update",
-                    "flow": flow.dict()
-                })
-
-            # Thread-safe removal from active flows
-            async with self._flows_lock:
-                if flow_key in self._active_flows:
-                    del self._active_flows[flow_key]
-
-            # Clean up tracking data
-            if flow_key in self._rtt_tracking:
-                del self._rtt_tracking[flow_key]
-            if flow_key in self._packet_timestamps:
-                del self._packet_timestamps[flow_key]
-            if flow_key in self._connection_states:
-                del self._connection_states[flow_key]
+            # Hand off to the batch writer (analyzes, saves and notifies clients)
+            try:
+                self._write_queue.put_nowait(flow)
+            except asyncio.QueueFull:
+                if self._running:
+                    # Never stall capture on a slow database
+                    self._flows_dropped += 1
+                else:
+                    await self._write_queue.put(flow)  # Shutdown: wait for the writer
 
         except Exception as e:
             logger.error(f"Error finalizing flow: {e}")
 
+    def _get_location_cached(self, ip: str) -> Dict[str, Optional[str]]:
+        """Geolocation for an IP (with caching)"""
+        current_time = monotonic()
+        cached = self._geo_cache.get(ip)
+        if cached is not None and current_time < cached[1]:
+            return cached[0]
+
+        location = self.geolocation_service.get_location(ip)
+        self._geo_cache[ip] = (location, current_time + self._geo_cache_max_age)
+        return location
+
+    async def _to_network_flow(self, flow: ActiveFlow) -> NetworkFlow:
+        """Analyze and enrich a finalized flow into its stored form"""
+        # Threat analysis works on plain dicts (named flags, mean RTT)
+        flow_data = flow.as_dict()
+
+        # Determine threat level
+        threat_level = "safe"
+        if self.threat_service:
+            threat_level = await self.threat_service.analyze_flow(flow_data)
+
+        # Get domain from cache or flow data
+        domain = flow.domain or self._dns_cache.get(flow.dest_ip)
+
+        # Get geolocation for destination IP
+        country = None
+        city = None
+        asn = None
+        if self.geolocation_service:
+            geo_info = self._get_location_cached(flow.dest_ip)
+            country = geo_info.get("country")
+            city = geo_info.get("city")
+            asn = geo_info.get("asn")
+
+        # Create NetworkFlow object
+        return NetworkFlow(
+            id=flow.id,
+            timestamp=flow.first_seen,
+            sourceIp=flow.source_ip,
+            sourcePort=flow.source_port,
+            destIp=flow.dest_ip,
+            destPort=flow.dest_port,
+            protocol=flow.protocol,
+            bytesIn=flow.bytes_in,
+            bytesOut=flow.bytes_out,
+            packetsIn=flow.packets_in,
+            packetsOut=flow.packets_out,
+            duration=flow.duration,
+            status="closed",
+            threatLevel=threat_level,
+            deviceId=flow.device_id,
+            domain=domain if domain else None,
+            sni=flow.sni,
+            country=country,
+            city=city,
+            asn=asn,
+            tcpFlags=flow_data.get("tcp_flags"),
+            ttl=flow.ttl,
+            connectionState=flow.connection_state,
+            rtt=flow_data.get("rtt"),
+            retransmissions=flow.retransmissions or None,
+            jitter=flow.jitter,
+            application=flow.application,
+            userAgent=flow.user_agent,
+            httpMethod=flow.http_method,
+            url=flow.url,
+            dnsQueryType=flow.dns_query_type,
+            dnsResponseCode=flow.dns_response_code
+        )
+
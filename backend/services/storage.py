@@ -299,6 +299,13 @@ class StorageService:
 
         await self.db.commit()
 
+    async def _commit(self):
+        """Commit on the legacy connection (pool connections autocommit)"""
+        if self.pool:
+            return
+        await self._ensure_connection()
+        await self.db.commit()
+
     async def _optimize_sqlite(self):
         """Optimize SQLite settings for Raspberry Pi 5"""
         # Enable WAL mode for better concurrency (readers don't block writers)
@@ -334,8 +341,7 @@ class StorageService:
         )
         threats_deleted = cursor.rowcount
 
-        await self._ensure_connection()
-        await self.db.commit()
+        await self._commit()
 
         logger.info(
             f"Cleanup completed: {flows_deleted} flows, "
@@ -445,25 +451,65 @@ class StorageService:
                 row = await cursor.fetchone()
                 return self._row_to_device(row) if row else None
 
+    # Update in place on either key instead of REPLACE's delete + insert
+    # (which rewrites every index entry); a known MAC adopts the new ID just
+    # as REPLACE did. When the ID and the MAC match two different rows,
+    # REPLACE deleted both; the upsert can only update one, so the stale ID
+    # row is deleted first (_DELETE_STALE_DEVICE_SQL)
+    _DEVICE_UPDATE_SET = """
+                id = excluded.id, name = excluded.name, ip = excluded.ip,
+                mac = excluded.mac, type = excluded.type, vendor = excluded.vendor,
+                os = excluded.os, first_seen = excluded.first_seen,
+                last_seen = excluded.last_seen, bytes_total = excluded.bytes_total,
+                connections_count = excluded.connections_count,
+                threat_score = excluded.threat_score, behavioral = excluded.behavioral,
+                notes = excluded.notes, ipv6_support = excluded.ipv6_support,
+                avg_rtt = excluded.avg_rtt, connection_quality = excluded.connection_quality,
+                applications = excluded.applications"""
+    _UPSERT_DEVICE_SQL = f"""
+            INSERT INTO devices
+            (id, name, ip, mac, type, vendor, os, first_seen, last_seen, bytes_total,
+             connections_count, threat_score, behavioral, notes, ipv6_support, avg_rtt,
+             connection_quality, applications)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET {_DEVICE_UPDATE_SET}
+            ON CONFLICT(mac) DO UPDATE SET {_DEVICE_UPDATE_SET}
+        """
+    _DELETE_STALE_DEVICE_SQL = """
+            DELETE FROM devices
+            WHERE id = ? AND mac <> ? AND EXISTS (SELECT 1 FROM devices WHERE mac = ?)
+        """
+
     async def upsert_device(self, device: Device):
         """Insert or update device"""
         # Convert applications list to comma-separated string
         applications_str = ",".join(device.applications) if device.applications else None
 
-        await self._execute_with_retry("""
-            INSERT OR REPLACE INTO devices
-            (id, name, ip, mac, type, vendor, os, first_seen, last_seen, bytes_total,
-             connections_count, threat_score, behavioral, notes, ipv6_support, avg_rtt,
-             connection_quality, applications)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        row = (
             device.id, device.name, device.ip, device.mac, device.type, device.vendor,
             device.os, device.firstSeen, device.lastSeen, device.bytesTotal, device.connectionsCount,
             device.threatScore, json.dumps(device.behavioral), device.notes,
             1 if device.ipv6Support else 0, device.avgRtt, device.connectionQuality, applications_str
-        ))
-        await self._ensure_connection()
-        await self.db.commit()
+        )
+        stale = (device.id, device.mac, device.mac)
+
+        if self.pool:
+            # Pool connections autocommit; keep the delete and the upsert
+            # in one transaction so a failed upsert doesn't lose the row
+            async with self.pool.acquire() as conn:
+                await conn.execute("BEGIN IMMEDIATE")
+                try:
+                    await conn.execute(self._DELETE_STALE_DEVICE_SQL, stale)
+                    await conn.execute(self._UPSERT_DEVICE_SQL, row)
+                except Exception:
+                    await conn.execute("ROLLBACK")
+                    raise
+                await conn.execute("COMMIT")
+            return
+
+        await self._execute_with_retry(self._DELETE_STALE_DEVICE_SQL, stale)
+        await self._execute_with_retry(self._UPSERT_DEVICE_SQL, row)
+        await self._commit()
 
     async def count_devices(self) -> int:
         """Count total devices"""
@@ -479,29 +525,58 @@ class StorageService:
                 return row[0] if row else 0
 
     # Flow methods
-    async def add_flow(self, flow: NetworkFlow):
-        """Add network flow"""
-        # Convert TCP flags list to comma-separated string
-        tcp_flags_str = ",".join(flow.tcpFlags) if flow.tcpFlags else None
-
-        await self._execute_with_retry("""
-            INSERT OR REPLACE INTO flows
+    # Flow IDs are unique per finalized flow, so rows are only appended
+    _INSERT_FLOW_SQL = """
+            INSERT OR IGNORE INTO flows
             (id, timestamp, source_ip, source_port, dest_ip, dest_port, protocol,
              bytes_in, bytes_out, packets_in, packets_out, duration, status,
              country, city, asn, domain, sni, threat_level, device_id,
              tcp_flags, ttl, connection_state, rtt, retransmissions, jitter,
              application, user_agent, http_method, url, dns_query_type, dns_response_code)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+                    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+
+    @staticmethod
+    def _flow_row(flow: NetworkFlow) -> tuple:
+        """Flatten a flow into the parameter tuple for _INSERT_FLOW_SQL"""
+        # Convert TCP flags list to comma-separated string
+        tcp_flags_str = ",".join(flow.tcpFlags) if flow.tcpFlags else None
+        return (
             flow.id, flow.timestamp, flow.sourceIp, flow.sourcePort, flow.destIp,
             flow.destPort, flow.protocol, flow.bytesIn, flow.bytesOut,
             flow.packetsIn, flow.packetsOut, flow.duration, flow.status,
             flow.country, flow.city, flow.asn, flow.domain, flow.sni, flow.threatLevel, flow.deviceId,
             tcp_flags_str, flow.ttl, flow.connectionState, flow.rtt, flow.retransmissions, flow.jitter,
             flow.application, flow.userAgent, flow.httpMethod, flow.url, flow.dnsQueryType, flow.dnsResponseCode
-        ))
+        )
+
+    async def add_flow(self, flow: NetworkFlow):
+        """Add network flow"""
+        await self.add_flows_batch([flow])
+
+    async def add_flows_batch(self, flows: List[NetworkFlow]):
+        """Add many network flows in a single transaction"""
+        if not flows:
+            return
+        rows = [self._flow_row(flow) for flow in flows]
+
+        if self.pool:
+            # Pool connections autocommit; wrap the batch in one transaction.
+            # IMMEDIATE takes the write lock up front so a concurrent writer
+            # can't make the commit fail halfway through with SQLITE_BUSY
+            async with self.pool.acquire() as conn:
+                await conn.execute("BEGIN IMMEDIATE")
+                try:
+                    await conn.executemany(self._INSERT_FLOW_SQL, rows)
+                except Exception:
+                    await conn.execute("ROLLBACK")
+                    raise
+                await conn.execute("COMMIT")
+            return
+
         await self._ensure_connection()
+        await self.db.executemany(self._INSERT_FLOW_SQL, rows)
         await self.db.commit()
 
     async def get_flows(self, limit: int = 100, device_id: Optional[str] = None,
@@ -675,7 +750,7 @@ class StorageService:
     async def add_threat(self, threat: Threat):
         """Add threat"""
         await self._execute_with_retry("""
-            INSERT OR REPLACE INTO threats
+            INSERT INTO threats
             (id, timestamp, type, severity, device_id, flow_id, description, recommendation, dismissed)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
@@ -683,8 +758,7 @@ class StorageService:
             threat.deviceId, threat.flowId, threat.description,
             threat.recommendation, 1 if threat.dismissed else 0
         ))
-        await self._ensure_connection()
-        await self.db.commit()
+        await self._commit()
 
     async def get_threats(self, active_only: bool = True) -> List[Threat]:
         """Get threats"""
@@ -778,15 +852,14 @@ class StorageService:
             threat.recommendation,
             1 if threat.dismissed else 0
         ))
-        await self._ensure_connection()
-        await self.db.commit()
+        await self._commit()
 
     async def dismiss_threat(self, threat_id: str) -> bool:
         """Dismiss a threat"""
-        cursor = await self.db.execute(
+        cursor = await self._execute_with_retry(
             "UPDATE threats SET dismissed = 1 WHERE id = ?", (threat_id,)
         )
-        await self.db.commit()
+        await self._commit()
         return cursor.rowcount > 0
 
     # Helper methods
@@ -825,13 +898,17 @@ class StorageService:
         )
 
     def _row_to_flow(self, row) -> NetworkFlow:
-        """Convert database row to NetworkFlow model"""
+        """Convert database row to NetworkFlow model
+
+        Rows were validated as NetworkFlow when they were written, so the
+        model is constructed without validating them again.
+        """
         # Parse TCP flags from comma-separated string
         tcp_flags = None
         if row["tcp_flags"]:
             tcp_flags = [f.strip() for f in row["tcp_flags"].split(",") if f.strip()]
 
-        return NetworkFlow(
+        return NetworkFlow.model_construct(
             id=row["id"],
             timestamp=row["timestamp"],
             sourceIp=row["source_ip"],
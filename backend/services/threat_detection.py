@@ -3,7 +3,7 @@ Threat detection and analysis service
 """
 import logging
 from typing import Dict, Optional, Callable
-from datetime import datetime
+from time import time_ns
 import uuid
 
 from models.types import Threat
@@ -164,7 +164,7 @@ class ThreatDetectionService:
 
             threat = Threat(
                 id=str(uuid.uuid4()),
-                timestamp=int(datetime.now().timestamp() * 1000),
+                timestamp=time_ns() // 1_000_000,
                 type=threat_type,
                 severity=severity,
                 deviceId=flow_data.get("device_id", "unknown"),
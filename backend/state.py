@@ -8,6 +8,7 @@ import asyncio
 import logging
 from typing import TYPE_CHECKING, List, Optional
 
+import orjson
 from fastapi import WebSocket
 
 if TYPE_CHECKING:
@@ -44,17 +45,30 @@ service_manager: Optional["ServiceManager"] = None
 active_connections: List[WebSocket] = []
 
 
+def _encode_default(obj):
+    """Serialize Pydantic models embedded in a message (e.g. flow batches)."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_message(data: dict) -> str:
+    """Serialize a WebSocket message (once, however many clients receive it)."""
+    return orjson.dumps(data, default=_encode_default).decode()
+
+
 async def notify_clients(data: dict) -> None:
     """Notify all connected WebSocket clients with retry logic."""
     if not active_connections:
         return
 
+    message = encode_message(data)
     disconnected = []
     failed_connections = []
 
     for connection in active_connections:
         try:
-            await asyncio.wait_for(connection.send_json(data), timeout=5.0)
+            await asyncio.wait_for(connection.send_text(message), timeout=5.0)
         except asyncio.TimeoutError:
             logger.warning("WebSocket send timeout - connection may be slow")
             failed_connections.append(connection)
@@ -79,7 +93,7 @@ async def notify_clients(data: dict) -> None:
         await asyncio.sleep(0.1)
         for connection in failed_connections[:]:
             try:
-                await asyncio.wait_for(connection.send_json(data), timeout=2.0)
+                await asyncio.wait_for(connection.send_text(message), timeout=2.0)
                 failed_connections.remove(connection)
             except Exception as e:
                 logger.warning(f"WebSocket retry failed: {e}")
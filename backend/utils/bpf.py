@@ -0,0 +1,85 @@
+"""
+Classic BPF socket filters
+Programs are attached with SO_ATTACH_FILTER directly; the default capture
+filter ships precompiled so starting capture needs neither libpcap nor tcpdump.
+"""
+import ctypes
+import socket
+import struct
+from functools import lru_cache
+from typing import Tuple
+
+SO_ATTACH_FILTER = getattr(socket, "SO_ATTACH_FILTER", 26)
+
+# struct sock_filter: code, jt, jf, k
+_SOCK_FILTER = struct.Struct("=HBBI")
+# struct sock_fprog: len, filter pointer (native alignment)
+_SOCK_FPROG = struct.Struct("HP")
+
+BPFProgram = Tuple[Tuple[int, int, int, int], ...]
+
+# Default capture filter: only frames that can become flows (or feed device
+# discovery), so other ethertypes (LLDP, STP, ...) and untracked IP protocols
+# (IGMP, ICMPv6, GRE, ...) never cross into user space. Ships precompiled
+DEFAULT_BPF_FILTER = "(ip and (tcp or udp or icmp)) or (ip6 and (tcp or udp)) or arp"
+
+# Programs for filters used without libpcap (on an Ethernet interface)
+PRECOMPILED_FILTERS = {
+    # Output of `tcpdump -dd 'ip or ip6 or arp'`
+    "ip or ip6 or arp": (
+        (0x28, 0, 0, 0x0000000C),  # ldh [12]            (ethertype)
+        (0x15, 2, 0, 0x00000800),  # jeq #0x800   -> accept
+        (0x15, 1, 0, 0x000086DD),  # jeq #0x86dd  -> accept
+        (0x15, 0, 1, 0x00000806),  # jeq #0x806   -> accept, else drop
+        (0x06, 0, 0, 0x00040000),  # ret #262144
+        (0x06, 0, 0, 0x00000000),  # ret #0
+    ),
+    # Hand-assembled: only the IP protocols that become flows. IPv6
+    # extension headers are not followed (the header parser doesn't either)
+    DEFAULT_BPF_FILTER: (
+        (0x28, 0, 0, 0x0000000C),  # ldh [12]            (ethertype)
+        (0x15, 0, 4, 0x00000800),  # jeq #0x800   -> else ipv6 check
+        (0x30, 0, 0, 0x00000017),  # ldb [23]            (IPv4 protocol)
+        (0x15, 7, 0, 0x00000006),  # jeq #6 (tcp)  -> accept
+        (0x15, 6, 0, 0x00000011),  # jeq #17 (udp) -> accept
+        (0x15, 5, 6, 0x00000001),  # jeq #1 (icmp) -> accept, else drop
+        (0x15, 0, 3, 0x000086DD),  # jeq #0x86dd  -> else arp check
+        (0x30, 0, 0, 0x00000014),  # ldb [20]            (IPv6 next header)
+        (0x15, 2, 0, 0x00000006),  # jeq #6 (tcp)  -> accept
+        (0x15, 1, 2, 0x00000011),  # jeq #17 (udp) -> accept, else drop
+        (0x15, 0, 1, 0x00000806),  # jeq #0x806   -> accept, else drop
+        (0x06, 0, 0, 0x00040000),  # ret #262144
+        (0x06, 0, 0, 0x00000000),  # ret #0
+    ),
+}
+
+
+@lru_cache(maxsize=16)
+def compile_filter(bpf_filter: str, interface: str) -> BPFProgram:
+    """Compile a filter expression to cBPF instructions (memoized)
+
+    Precompiled programs are returned as-is; anything else is compiled
+    through Scapy (libpcap or tcpdump).
+    """
+    program = PRECOMPILED_FILTERS.get(bpf_filter)
+    if program is not None:
+        return program
+
+    from scapy.arch.common import compile_filter as scapy_compile_filter
+    bpf = scapy_compile_filter(bpf_filter, iface=interface)
+    return tuple(
+        (insn.code, insn.jt, insn.jf, insn.k & 0xFFFFFFFF)
+        for insn in bpf.bf_insns[:bpf.bf_len]
+    )
+
+
+def attach_filter(sock: socket.socket, bpf_filter: str, interface: str):
+    """Attach a filter expression to a socket in the kernel"""
+    program = compile_filter(bpf_filter, interface)
+    instructions = ctypes.create_string_buffer(
+        b"".join(_SOCK_FILTER.pack(*insn) for insn in program)
+    )
+    # The kernel copies the program during setsockopt, so the buffer only
+    # has to outlive this call
+    fprog = _SOCK_FPROG.pack(len(program), ctypes.addressof(instructions))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
@@ -7,6 +7,8 @@ from pathlib import Path
 from typing import List, Optional
 from dotenv import load_dotenv
 
+from utils.bpf import DEFAULT_BPF_FILTER
+
 logger = logging.getLogger(__name__)
 
 
@@ -198,6 +200,24 @@ class Config:
         except ValueError:
             return 600
 
+    @property
+    def capture_bpf_filter(self) -> str:
+        """BPF filter applied in the kernel before packets reach Python"""
+        return os.getenv("CAPTURE_BPF_FILTER", "").strip() or DEFAULT_BPF_FILTER
+
+    @property
+    def capture_dedup(self) -> bool:
+        """Drop duplicate frames (for mirror/tee setups that see packets twice)"""
+        return os.getenv("CAPTURE_DEDUP", "false").lower() == "true"
+
+    @property
+    def capture_cpu(self) -> Optional[int]:
+        """CPU core to pin the capture thread to (unset = no pinning)"""
+        try:
+            return int(os.getenv("CAPTURE_CPU", ""))
+        except ValueError:
+            return None
+
     @property
     def enable_dns_tracking(self) -> bool:
         """Enable DNS query tracking for IP-to-domain mapping"""
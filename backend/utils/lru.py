@@ -0,0 +1,47 @@
+"""
+Size-bounded LRU mapping
+Keeps long-running caches at a constant memory footprint
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+_MISSING = object()
+
+
+class LRUDict(OrderedDict):
+    """OrderedDict that evicts its least recently used entry past maxsize
+
+    Assignment and item lookups (``d[key]``, ``d.get(key)``) mark an entry as
+    recently used; membership tests and iteration do not.
+    """
+
+    def __init__(self, maxsize: int, on_evict: Optional[Callable[[Any, Any], None]] = None):
+        """
+        Args:
+            maxsize: Maximum number of entries kept
+            on_evict: Called with (key, value) for every evicted entry
+        """
+        super().__init__()
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self.move_to_end(key)
+        super().__setitem__(key, value)
+        if len(self) > self.maxsize:
+            evicted_key, evicted_value = self.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted_value)
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        value = super().get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        self.move_to_end(key)
+        return value
@@ -0,0 +1,46 @@
+"""
+IP address helpers shared by the capture and enrichment services
+"""
+import socket
+import struct
+from functools import lru_cache
+
+_IPV4 = struct.Struct("!I")
+
+# Private, loopback and link-local IPv4 ranges as (network, netmask)
+_LOCAL_IPV4_RANGES = tuple(
+    (_IPV4.unpack(socket.inet_aton(network))[0], netmask)
+    for network, netmask in (
+        ("10.0.0.0", 0xFF000000),
+        ("172.16.0.0", 0xFFF00000),
+        ("192.168.0.0", 0xFFFF0000),
+        ("127.0.0.0", 0xFF000000),
+        ("169.254.0.0", 0xFFFF0000),
+    )
+)
+
+# Unique-local (fc00::/7), link-local (fe80::/10) and loopback (::1) IPv6
+# ranges as (network, netmask) on the 128-bit integer address
+_LOCAL_IPV6_RANGES = (
+    (0xFC << 120, 0xFE << 120),
+    (0xFE80 << 112, 0xFFC0 << 112),
+    (1, (1 << 128) - 1),
+)
+
+
+@lru_cache(maxsize=8192)
+def is_local_ip(ip: str) -> bool:
+    """Check if an IPv4/IPv6 address is private, loopback or link-local"""
+    try:
+        if ":" in ip:
+            ip_int = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+            ranges = _LOCAL_IPV6_RANGES
+        else:
+            ip_int = _IPV4.unpack(socket.inet_aton(ip))[0]
+            ranges = _LOCAL_IPV4_RANGES
+    except OSError:
+        return False  # Not an IP address
+    for network, netmask in ranges:
+        if ip_int & netmask == network:
+            return True
+    return False
@@ -81,6 +81,9 @@ class ServiceManager:
             geolocation_service=self.geolocation_service,
             on_flow_update=on_flow_update,
             enhanced_identification=enhanced_identification,
+            bpf_filter=config.capture_bpf_filter,
+            enable_dedup=config.capture_dedup,
+            capture_cpu=config.capture_cpu,
         )
 
         logger.info("All services initialized successfully")
@@ -242,6 +242,65 @@ describe('useApiData', () => {
       });
     });
 
+    it('should merge flows when flow_batch message is received', async () => {
+      const mockHealth = {
+        status: 'healthy',
+        timestamp: new Date().toISOString(),
+        capture_running: true,
+        active_flows: 10,
+        active_devices: 5,
+      };
+
+      let wsCallback:
+        | ((data: {
+            type: string;
+            flow?: NetworkFlow;
+            device?: Device;
+            threat?: Threat;
+            devices?: Device[];
+            flows?: NetworkFlow[];
+            threats?: Threat[];
+          }) => void)
+        | null = null;
+
+      vi.mocked(apiClient.healthCheck).mockResolvedValue(mockHealth);
+      vi.mocked(apiClient.getDevices).mockResolvedValue([mockDevice]);
+      vi.mocked(apiClient.getFlows).mockResolvedValue([mockFlow]);
+      vi.mocked(apiClient.getThreats).mockResolvedValue([]);
+      vi.mocked(apiClient.getAnalytics).mockResolvedValue([]);
+      vi.mocked(apiClient.getProtocolStats).mockResolvedValue([]);
+      vi.mocked(apiClient.connectWebSocket).mockImplementation(callback => {
+        wsCallback = callback;
+        return () => {};
+      });
+
+      const { result } = renderHook(() => useApiData({ useWebSocket: true }));
+
+      await waitFor(() => {
+        expect(result.current.isConnected).toBe(true);
+      });
+
+      const updatedFlow = { ...mockFlow, bytesIn: 2000 };
+      const newFlow: NetworkFlow = {
+        ...mockFlow,
+        id: 'flow-2',
+        destIp: '1.1.1.1',
+      };
+
+      act(() => {
+        wsCallback?.({
+          type: 'flow_batch',
+          flows: [updatedFlow, newFlow],
+        });
+      });
+
+      await waitFor(() => {
+        const flows = result.current.flows;
+        expect(flows[0].id).toBe('flow-2');
+        expect(flows.find(f => f.id === 'flow-1')?.bytesIn).toBe(2000);
+      });
+    });
+
     it('should update devices when device_update message is received', async () => {
       const mockHealth = {
         status: 'healthy',
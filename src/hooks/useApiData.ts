@@ -118,6 +118,25 @@ export function useApiData(options: UseApiDataOptions = {}) {
             }
             break;
 
+          case 'flow_batch':
+            if (message.flows && Array.isArray(message.flows)) {
+              const batch = message.flows as NetworkFlow[];
+              setFlows(current => {
+                const updated = [...current];
+                const added: NetworkFlow[] = [];
+                for (const flow of batch) {
+                  const existing = updated.findIndex(f => f.id === flow.id);
+                  if (existing >= 0) {
+                    updated[existing] = flow;
+                  } else {
+                    added.unshift(flow);
+                  }
+                }
+                return [...added, ...updated].slice(0, 100);
+              });
+            }
+            break;
+
           case 'device_update':
             if (message.device && typeof message.device === 'object') {
               const device = message.device as Device;